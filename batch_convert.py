@@ -0,0 +1,199 @@
+"""
+Converts a directory of WhatsApp export ZIPs to static HTML and JSON for archiving, one chat per worker process.
+Every chat gets a directory of its own in the output directory, named after its ZIP, holding:
+    index.html, page-2.html, ...  the chat, paginated, viewable straight from disk
+    messages.json                 the parsed chat as a single JSON document
+    messages.ndjson               the same messages, one JSON object per line
+    media/                        everything the export contains
+Run from the project root:
+    python batch_convert.py <directory of ZIPs> <output directory> [--workers N] [--page-size N]
+Flask isn't needed, nor imported: the chats are parsed by chat_parser and rendered with Jinja.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache, partial
+from urllib.parse import quote
+from zipfile import BadZipFile, ZipFile
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from chat_parser import (TamperedFileError, build_catalog, get_chat_page, get_files_by_extension, get_names,
+                         iter_chat_file, organize_msgs, parse_chat, sniff_chat_format)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Messages per HTML page, a few times the web view's window since a page is loaded once and scrolled natively.
+DEFAULT_PAGE_SIZE = 1000
+# json.dumps builds a new encoder on every call with non-default options, the dumps share this one.
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+@lru_cache(maxsize=None)
+def template_environment() -> Environment:
+    """
+    Returns the Jinja environment of the app's templates, created once per worker process.
+    """
+    return Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(["html"]))
+
+
+def media_url(catalog, endpoint: str, filename: str = None, **values) -> str:
+    """
+    Stands in for Flask's url_for in the templates, pointing attachments at the chat's extracted media.
+    There are no thumbnails or posters offline, previews show the attachment itself.
+    Args:
+        catalog (AttachmentCatalog): The chat's attachments, to find the member a file name refers to.
+        endpoint (str): "chat_media" or "chat_preview".
+        filename (str, optional): The attachment's file name as used in the chat.
+    Returns:
+        str: The attachment's URL, relative to the chat's pages.
+    Raises:
+        ValueError: For any other endpoint, static pages have no server to link to.
+    """
+    if endpoint not in ("chat_media", "chat_preview"):
+        raise ValueError(f"no static URL for {endpoint}")
+    return "media/" + quote(catalog.resolve(filename) or filename)
+
+
+def page_name(page: int) -> str:
+    """
+    Returns the file name of a page of a converted chat, the first one being index.html.
+    """
+    return "index.html" if page == 0 else f"page-{page + 1}.html"
+
+
+def write_json(chat, chat_dir: str, title: str, username: str):
+    """
+    Dumps a parsed chat as messages.json and messages.ndjson, writing one message at a time.
+    Args:
+        chat (CompactChat): The parsed chat.
+        chat_dir (str): Where to write the files.
+        title (str): The chat's name.
+        username (str or None): The participant the chat was exported by, as far as it can be told.
+    """
+    header = JSON_ENCODER.encode({"title": title, "username": username, "senders": get_names(chat), "total": len(chat)})
+    with open(os.path.join(chat_dir, "messages.json"), "w", encoding="utf-8") as json_file, \
+            open(os.path.join(chat_dir, "messages.ndjson"), "w", encoding="utf-8") as ndjson_file:
+        json_file.write(header[:-1] + ', "messages": [')
+        for index, message in enumerate(chat):
+            line = JSON_ENCODER.encode(message.to_dict())
+            json_file.write(f"\n{line}" if index == 0 else f",\n{line}")
+            ndjson_file.write(line + "\n")
+        json_file.write("\n]}\n")
+
+
+def write_pages(chat, chat_dir: str, title: str, username: str, catalog, page_size: int) -> int:
+    """
+    Renders a parsed chat as static HTML pages of 'page_size' messages.
+    Returns:
+        int: The number of pages written.
+    """
+    template = template_environment().get_template("static-chat.html")
+    pages = max(1, -(-len(chat) // page_size))
+    page_names = [page_name(page) for page in range(pages)]
+    url_for = partial(media_url, catalog)
+    for page in range(pages):
+        offset = page * page_size
+        html = template.render(title=title, messages=get_chat_page(chat, offset, page_size), offset=offset,
+                               username=username, page=page, pages=pages, page_names=page_names, url_for=url_for)
+        with open(os.path.join(chat_dir, page_names[page]), "w", encoding="utf-8") as file:
+            file.write(html)
+    return pages
+
+
+def convert_archive(archive: str, output_dir: str, page_size: int = DEFAULT_PAGE_SIZE, username: str = None) -> dict:
+    """
+    Converts one export ZIP: extracts it, parses the chat and writes its pages and JSON dumps.
+    Runs in a worker process, so only plain values go in and out.
+    Args:
+        archive (str): Path of the ZIP file.
+        output_dir (str): The chat's directory is created in it, replacing any earlier conversion.
+        page_size (int, optional): Messages per HTML page.
+        username (str, optional): Whose messages are shown as sent. Defaults to the first sender, alphabetically.
+    Returns:
+        dict: The chat's directory, its number of messages and pages, and the archive's size in bytes.
+    Raises:
+        BadZipFile: If the file isn't a ZIP.
+        FileNotFoundError: If the archive has no WhatsApp chat text file at its top level.
+        TamperedFileError: If the chat text isn't in any known format.
+    """
+    title = os.path.splitext(os.path.basename(archive))[0]
+    chat_dir = os.path.join(output_dir, title)
+    media_dir = os.path.join(chat_dir, "media")
+    # Not extract_zipfile, which reports every directory it clears: a batch would print a line per chat.
+    shutil.rmtree(chat_dir, ignore_errors=True)
+    with ZipFile(archive) as zip_file:
+        zip_file.extractall(media_dir)
+    catalog = build_catalog(archive)
+    chat_format, lines = sniff_chat_format(iter_chat_file(get_files_by_extension(media_dir, ".txt"), media_dir))
+    chat = parse_chat(organize_msgs(lines, chat_format), catalog, chat_format)
+    senders = get_names(chat)
+    if username is None and senders:
+        username = senders[0]
+    write_json(chat, chat_dir, title, username)
+    pages = write_pages(chat, chat_dir, title, username, catalog, page_size)
+    return {"chat_dir": chat_dir, "messages": len(chat), "pages": pages, "bytes": os.path.getsize(archive)}
+
+
+def convert_directory(input_dir: str, output_dir: str, workers: int = None, page_size: int = DEFAULT_PAGE_SIZE,
+                      username: str = None) -> dict:
+    """
+    Converts every export ZIP in a directory, spreading the chats over a pool of worker processes.
+    A chat that fails to convert is reported and skipped, the others carry on.
+    Args:
+        input_dir (str): Directory holding the ZIP files.
+        output_dir (str): Where to write the converted chats.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        page_size (int, optional): Messages per HTML page.
+        username (str, optional): Whose messages are shown as sent, in every chat.
+    Returns:
+        dict: Chats converted and failed, messages and archive bytes converted, and the seconds it all took.
+    """
+    archives = [os.path.join(input_dir, name) for name in os.listdir(input_dir) if name.lower().endswith(".zip")]
+    # Largest first, so one big chat started last doesn't keep the other workers idle at the end.
+    archives.sort(key=os.path.getsize, reverse=True)
+    os.makedirs(output_dir, exist_ok=True)
+    totals = {"chats": 0, "failed": 0, "messages": 0, "bytes": 0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {pool.submit(convert_archive, archive, output_dir, page_size, username): archive
+                   for archive in archives}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except (BadZipFile, TamperedFileError, OSError, ValueError) as error:
+                totals["failed"] += 1
+                print(f"Couldn't convert {futures[future]}: {error!r}")
+                continue
+            totals["chats"] += 1
+            totals["messages"] += result["messages"]
+            totals["bytes"] += result["bytes"]
+            print(f"{result['chat_dir']}: {result['messages']:,} messages, {result['pages']} pages")
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="directory holding the export ZIPs")
+    parser.add_argument("output_dir", help="where to write the converted chats")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="messages per HTML page")
+    parser.add_argument("--username", help="whose messages are shown as sent, defaults to the first sender")
+    args = parser.parse_args()
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+
+    totals = convert_directory(args.input_dir, args.output_dir, args.workers, args.page_size, args.username)
+    seconds = totals["seconds"] or float("inf")
+    print(f"\n{totals['chats']} chats ({totals['failed']} failed), {totals['messages']:,} messages, "
+          f"{totals['bytes'] / 2**20:.1f} MB in {totals['seconds']:.2f}s: "
+          f"{totals['chats'] / seconds:.2f} chats/s, {totals['bytes'] / 2**20 / seconds:.2f} MB/s")
+    sys.exit(1 if totals["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Page, name listing, day index and search latency of a chat kept in SQLite (ChatDatabase) at growing chat sizes,
+to check they stay flat, next to the time it takes to write the database.
+Run from the project root:
+    python -m benchmarks.bench_chat_database
+    python -m benchmarks.bench_chat_database --messages 5000000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date
+
+from chat_database import ChatDatabase, write_chat_database
+from chat_parser import get_names, organize_msgs, parse_chat
+from benchmarks.synthetic import synthetic_lines
+
+PAGE_SIZE = 200
+
+
+def median_ms(function, repeat: int) -> float:
+    """
+    Runs a function 'repeat' times and returns its median time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    operations = {
+        "first page": lambda db: db[0:PAGE_SIZE],
+        "middle page": lambda db: db[len(db) // 2:len(db) // 2 + PAGE_SIZE],
+        "last page": lambda db: db[len(db) - PAGE_SIZE:],
+        "get_names": get_names,
+        "days": lambda db: db.days(),
+        "search word": lambda db: db.search("wahala"),
+        "search words+sender": lambda db: db.search("see you later", sender="Tolu"),
+        "search month": lambda db: db.search(start=date(2023, 6, 1), end=date(2023, 6, 30)),
+        "search type+sender": lambda db: db.search(msg_type="image", sender="Ada"),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in args.messages:
+            chat = parse_chat(organize_msgs(synthetic_lines(count, multiline_ratio=0.1, media_ratio=0.05)))
+            path = os.path.join(work_dir, f"chat-{count}.sqlite3")
+            start = time.perf_counter()
+            write_chat_database(chat, path, args.batch_size)
+            written = time.perf_counter() - start
+            del chat
+            database = ChatDatabase(path)
+            results[count] = {"write (s)": written, "size (MB)": os.path.getsize(path) / 2**20}
+            results[count].update((f"{name} (ms)", median_ms(lambda: operation(database), args.repeat))
+                                  for name, operation in operations.items())
+            database.close()
+
+    print(f"{'messages':<26}" + "".join(f"{count:>14,}" for count in results))
+    for row in next(iter(results.values())):
+        print(f"{row:<26}" + "".join(f"{values[row]:>14.2f}" for values in results.values()))
+
+
+if __name__ == "__main__":
+    main()
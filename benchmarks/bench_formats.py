@@ -0,0 +1,64 @@
+"""
+Format detection against the sample exports in benchmarks/corpus, then parsing throughput for every chat format.
+Each corpus file is named after the format it's in ("<format>.txt" or "<format>.<note>.txt").
+Run from the project root:
+    python -m benchmarks.bench_formats
+"""
+import argparse
+import os
+import time
+
+from chat_parser import CHAT_FORMATS, detect_chat_format, iter_organized_msgs, parse_chat
+from benchmarks.synthetic import synthetic_lines
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+
+def check_corpus() -> bool:
+    """
+    Detects the format of every corpus file and parses it, printing one line per file.
+    Returns:
+        bool: Whether every file was detected as the format it's named after.
+    """
+    ok = True
+    print(f"{'corpus file':<42} {'detected':<24} {'messages':>8}")
+    for file_name in sorted(os.listdir(CORPUS_DIR)):
+        with open(os.path.join(CORPUS_DIR, file_name), encoding="utf-8-sig") as file:
+            lines = file.readlines()
+        chat_format = detect_chat_format(lines)
+        chat = parse_chat(list(iter_organized_msgs(lines, chat_format)), chat_format=chat_format)
+        expected = file_name.split(".")[0]
+        ok &= chat_format.name == expected
+        mark = "" if chat_format.name == expected else f"  MISMATCH, expected {expected}"
+        print(f"{file_name:<42} {chat_format.name:<24} {len(chat):>8}{mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=500_000)
+    args = parser.parse_args()
+
+    ok = check_corpus()
+    print()
+    print(f"{'format':<24} {'detect ms':>9} {'merge lines/s':>14} {'parse msg/s':>12}")
+    for chat_format in CHAT_FORMATS:
+        lines = synthetic_lines(args.lines, multiline_ratio=0.1, media_ratio=0.05, chat_format=chat_format.name)
+        start = time.perf_counter()
+        detected = detect_chat_format(lines[:1000])
+        detect = time.perf_counter() - start
+        assert detected is chat_format, f"{chat_format.name} detected as {detected.name}"
+        chat_format.parse_date.cache_clear()
+        start = time.perf_counter()
+        messages = list(iter_organized_msgs(lines, chat_format))
+        merge = time.perf_counter() - start
+        start = time.perf_counter()
+        parse_chat(messages, chat_format=chat_format)
+        parse = time.perf_counter() - start
+        print(f"{chat_format.name:<24} {detect * 1000:>9.1f} {len(lines) / merge:>14,.0f} {len(messages) / parse:>12,.0f}")
+    if not ok:
+        raise SystemExit("some corpus files were detected as the wrong format")
+
+
+if __name__ == "__main__":
+    main()
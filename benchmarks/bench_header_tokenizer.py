@@ -0,0 +1,74 @@
+"""
+Messages per second for pulling date, time, sender and body out of each message, comparing the old
+caution_split + strptime approach with the precompiled header grammar of the Android (US) format and its date
+memo cache. See bench_formats for the other formats.
+Run from the project root:
+    python -m benchmarks.bench_header_tokenizer
+"""
+import argparse
+import time
+from datetime import datetime
+
+from chat_parser import get_chat_format, organize_msgs
+from benchmarks.synthetic import synthetic_lines
+
+
+def legacy_caution_split(text: str, delimiter: str, n: int) -> list:
+    """
+    The original caution_split, kept here as the baseline.
+    """
+    split_text = text.split(delimiter)
+    if len(split_text) > n:
+        last_part = ""
+        for j in range(len(split_text)):
+            if j < n-1:
+                continue
+            last_part += split_text[j] + delimiter
+        final_split = split_text
+        split_text = []
+        for i in range(n-1):
+            split_text.append(final_split[i])
+        split_text.append(last_part)
+    return split_text
+
+
+def legacy_tokenize(messages: list) -> list:
+    tokens = []
+    for i in messages:
+        temp_list = legacy_caution_split(i, " - ", 2)
+        date, time_ = temp_list[0].split(", ")
+        if ":" not in temp_list[1]:
+            tokens.append((datetime.strptime(date, "%m/%d/%y"), time_, None, temp_list[1]))
+            continue
+        name, msg_body = legacy_caution_split(temp_list[1], ": ", 2)
+        tokens.append((datetime.strptime(date, "%m/%d/%y"), time_, name, msg_body))
+    return tokens
+
+
+ANDROID_US = get_chat_format("android-us")
+
+
+def regex_tokenize(messages: list) -> list:
+    tokens = []
+    for i in messages:
+        date, time_, name, msg_body = ANDROID_US.header.match(i).group("date", "time", "name", "body")
+        tokens.append((ANDROID_US.parse_date(date), time_, name, msg_body))
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    messages = organize_msgs(synthetic_lines(args.messages, multiline_ratio=0))
+    for label, func in (("caution_split + strptime", legacy_tokenize), ("header grammar + memo", regex_tokenize)):
+        ANDROID_US.parse_date.cache_clear()
+        start = time.perf_counter()
+        func(messages)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<26} {len(messages) / elapsed:>12,.0f} msg/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Bytes transferred for the welcome page's assets and the chat page's GIFs, on a first and a repeat visit, with
+static fingerprinting and precompression off (every asset revalidated, sent uncompressed) and on.
+Also checks that a Range request for the end of a GIF only transfers that part.
+Run from the project root:
+    python -m benchmarks.bench_http_cache
+"""
+import json
+import os
+import re
+import time
+
+from main import app, asset_url
+
+ASSET_PATTERN = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+ACCEPT_ENCODING = "gzip, deflate, br"
+
+
+def transferred(response) -> int:
+    """
+    Bytes a response puts on the wire, headers included.
+    """
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return headers + len(response.get_data())
+
+
+class Browser:
+    """
+    A browser cache, just enough of one to tell which requests a repeat visit makes.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}
+
+    def fetch(self, url: str) -> tuple:
+        """
+        Gets a URL the way a browser would, from its cache if fresh, with a conditional request otherwise.
+        Returns:
+            tuple: Requests made (0 or 1) and bytes transferred.
+        """
+        cached = self.cache.get(url)
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if cached is not None:
+            etag, expires = cached
+            if time.time() < expires:
+                return 0, 0
+            headers["If-None-Match"] = etag
+        response = self.client.get(url, headers=headers)
+        assert response.status_code in (200, 304), (url, response.status_code)
+        if response.status_code == 200:
+            max_age = response.cache_control.max_age or 0
+            self.cache[url] = (response.headers.get("ETag"), time.time() + max_age)
+        return 1, transferred(response)
+
+
+def visit(browser: Browser, urls: list) -> tuple:
+    """
+    Fetches every URL of a visit.
+    Returns:
+        tuple: Requests made and bytes transferred.
+    """
+    requests, size = 0, 0
+    for url in urls:
+        made, sent = browser.fetch(url)
+        requests += made
+        size += sent
+    return requests, size
+
+
+def asset_urls(client) -> list:
+    """
+    URLs of the welcome page's assets and of the local GIFs shown beside the chat (those that exist).
+    """
+    urls = ASSET_PATTERN.findall(client.get("/").get_data(as_text=True))
+    with open("gifs.json", "r") as file:
+        gifs = json.load(file)
+    with app.test_request_context():
+        urls += [asset_url(gif) for gif in gifs["gif1"] + gifs["gif2"]
+                 if gif.startswith("../static/") and os.path.isfile(gif[len("../"):])]
+    return list(dict.fromkeys(url.replace("&amp;", "&") for url in urls))
+
+
+def main():
+    print(f"{'setup':<10} {'first visit':>22} {'repeat visit':>22}")
+    for label, enabled in (("plain", False), ("cached", True)):
+        app.config['STATIC_FINGERPRINT'] = app.config['STATIC_PRECOMPRESS'] = enabled
+        client = app.test_client()
+        urls = asset_urls(client)
+        browser = Browser(client)
+        first = visit(browser, urls)
+        repeat = visit(browser, urls)
+        print(f"{label:<10} {first[0]:>5} req {first[1]:>12,} B {repeat[0]:>5} req {repeat[1]:>12,} B")
+
+    client = app.test_client()
+    gif = max((url for url in asset_urls(client) if url.endswith(".gif") or ".gif?" in url),
+              key=lambda url: len(client.get(url).get_data()))
+    full = client.get(gif)
+    tail = client.get(gif, headers={"Range": "bytes=-65536"})
+    assert tail.status_code == 206, tail.status_code
+    print(f"\nRange request for the last 64KB of {gif.split('?')[0]}: "
+          f"{transferred(tail):,} B instead of {transferred(full):,} B")
+
+
+if __name__ == "__main__":
+    main()
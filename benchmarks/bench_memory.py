@@ -0,0 +1,52 @@
+"""
+Memory held by a parsed chat, as a list of Message objects and packed in a CompactChat, in bytes per message.
+Run from the project root:
+    python -m benchmarks.bench_memory
+"""
+import argparse
+import gc
+import pickle
+import time
+import tracemalloc
+
+from chat_parser import CompactChat, iter_parse_chat, organize_msgs
+from benchmarks.synthetic import synthetic_lines
+
+
+def measure(build) -> tuple:
+    """
+    Builds a chat and returns it, with the bytes allocated for it that are still held afterwards.
+    """
+    gc.collect()
+    tracemalloc.start()
+    chat = build()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return chat, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    messages = organize_msgs(synthetic_lines(args.messages, multiline_ratio=0.1, media_ratio=0.05))
+    body_bytes = sum(len(message.encode("utf-8")) for message in messages)
+    print(f"{len(messages):,} messages, {body_bytes / len(messages):.0f} bytes of raw text each on average")
+    print(f"{'representation':<20} {'bytes/message':>14} {'total MB':>9} {'pickled MB':>11} {'read all s':>11}")
+    for label, build in (("list of Message", lambda: list(iter_parse_chat(messages))),
+                         ("CompactChat", lambda: CompactChat(iter_parse_chat(messages)))):
+        chat, held = measure(build)
+        pickled = len(pickle.dumps(chat, protocol=pickle.HIGHEST_PROTOCOL))
+        start = time.perf_counter()
+        for _ in chat:
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{label:<20} {held / len(chat):>14.0f} {held / 2 ** 20:>9.1f} {pickled / 2 ** 20:>11.1f} "
+              f"{elapsed:>11.2f}")
+        del chat
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the old restart-from-the-top organize_msgs with the single-pass one on synthetic exports.
+Run from the project root:
+    python -m benchmarks.bench_organize_msgs
+"""
+import argparse
+import time
+
+from chat_parser import TamperedFileError, organize_msgs, verify_date
+from benchmarks.synthetic import synthetic_lines
+
+
+def legacy_organize_msgs(msg_list: list) -> list:
+    """
+    The original organize_msgs, kept here verbatim as the baseline.
+    """
+    stopped = 0
+    start_over = False
+    msg_list = msg_list.copy()
+
+    while True:
+        for i in range(len(msg_list)):
+            if stopped == len(msg_list):
+                start_over = False
+                continue
+            if i < stopped:
+                continue
+            if not verify_date(msg_list[i].split(", ")[0]):
+                if i == 0:
+                    raise TamperedFileError
+                added = msg_list[i - 1] + " " + msg_list[i]
+                msg_list[i - 1] = added
+                msg_list.pop(i)
+                stopped = i
+                start_over = True
+                break
+            start_over = False
+        if start_over:
+            continue
+        break
+    return msg_list
+
+
+def time_call(func, lines):
+    start = time.perf_counter()
+    result = func(lines)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--multiline-ratio", type=float, default=0.2)
+    parser.add_argument("--legacy-max-lines", type=int, default=100_000,
+                        help="Skip the quadratic baseline above this many lines.")
+    args = parser.parse_args()
+
+    print(f"{'lines':>10} {'legacy (s)':>12} {'single pass (s)':>16} {'speedup':>9}")
+    for size in args.sizes:
+        lines = synthetic_lines(size, args.multiline_ratio)
+        new_time, new_result = time_call(organize_msgs, lines)
+        if size > args.legacy_max_lines:
+            print(f"{size:>10} {'skipped':>12} {new_time:>16.3f} {'-':>9}")
+            continue
+        old_time, old_result = time_call(legacy_organize_msgs, lines)
+        assert old_result == new_result, "single pass merger disagrees with the baseline"
+        print(f"{size:>10} {old_time:>12.3f} {new_time:>16.3f} {old_time / new_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Speedup of parse_chat_parallel over the serial parse_chat as the number of worker processes grows.
+Run from the project root:
+    python -m benchmarks.bench_parallel_parse
+"""
+import argparse
+import os
+import time
+
+import chat_parser
+from chat_parser import organize_msgs, parse_chat, parse_chat_parallel
+from benchmarks.synthetic import synthetic_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    args = parser.parse_args()
+
+    messages = organize_msgs(synthetic_lines(args.messages, multiline_ratio=0.1, media_ratio=0.05))
+    start = time.perf_counter()
+    expected = parse_chat(messages)
+    serial = time.perf_counter() - start
+    print(f"{len(messages):,} messages on {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:>9.2f} {1:>7.2f}x")
+
+    for workers in args.workers:
+        # Start a fresh pool of the requested size, and warm it up so process start-up isn't timed.
+        if chat_parser._parse_pool is not None:
+            chat_parser._parse_pool.shutdown()
+            chat_parser._parse_pool = None
+        chat_parser.get_parse_pool(workers).submit(len, []).result()
+        start = time.perf_counter()
+        result = parse_chat_parallel(messages, workers=workers, threshold=0 if workers > 1 else len(messages) + 1,
+                                     chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+        assert [(m.date, m.body, m.new_day) for m in result] == [(m.date, m.body, m.new_day) for m in expected]
+        print(f"{workers:>8} {elapsed:>9.2f} {serial / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
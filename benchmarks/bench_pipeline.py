@@ -0,0 +1,152 @@
+"""
+Times every stage of getting an export on screen, on a seeded synthetic export ZIP: saving the upload, extracting it,
+reading, merging and parsing the chat text, the streaming parse_archive that uploads actually use, and rendering
+chat.html. Results are written as JSON so runs on different commits can be compared:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/pipeline-<older commit>.json
+Run from the project root.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from flask import render_template
+
+import chat_parser
+import main as chat_viewer
+from benchmarks.synthetic import synthetic_export
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_commit() -> str:
+    """
+    Returns the short hash of the checked out commit, with "-dirty" if there are changes, or "unknown".
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def time_stages(archive: str, work_dir: str) -> dict:
+    """
+    Runs every stage once on an archive.
+    Returns:
+        dict: Seconds taken by each stage, in pipeline order.
+    """
+    timings = {}
+
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    with open(archive, "rb") as upload:
+        saved, _ = timed("save_archive", chat_viewer.save_archive, upload, os.path.join(work_dir, "saved"))
+    timed("extract_zipfile", chat_parser.extract_zipfile, saved, os.path.join(work_dir, "extracted"))
+    catalog = timed("build_catalog", chat_parser.build_catalog, saved)
+    lines = timed("read_chat_file", lambda: list(chat_parser.iter_zipped_chat_file(saved)))
+    chat_format = timed("detect_format", chat_parser.detect_chat_format, lines[:chat_parser.FORMAT_SAMPLE_LINES])
+    messages = timed("organize_msgs", chat_parser.organize_msgs, lines, chat_format)
+    chat = timed("parse_chat", chat_parser.parse_chat, messages, catalog, chat_format)
+    timed("parse_archive", chat_viewer.parse_archive, saved)
+    timed("chat_stats", chat_viewer.chat_stats, chat)
+    page_size = chat_viewer.app.config['CHAT_PAGE_SIZE']
+    with chat_viewer.app.test_request_context():
+        timed("render_chat", render_template, "chat.html", chat_id="0" * 32,
+              messages=chat_parser.get_chat_page(chat, 0, page_size), offset=0, page_size=page_size, total=len(chat),
+              username=chat_parser.get_names(chat)[0], left_gifs=[], right_gifs=[])
+    shutil.rmtree(os.path.join(work_dir, "saved"))
+    return timings
+
+
+def compare(results: dict, before: dict):
+    """
+    Prints each stage's time next to the one in earlier results.
+    """
+    if before["parameters"] != results["parameters"]:
+        print(f"note: the earlier run had different parameters: {before['parameters']}")
+    print(f"\n{'stage':<16} {before['commit']:>14} {results['commit']:>14} {'change':>8}")
+    for stage, seconds in results["stages"].items():
+        old = before["stages"].get(stage)
+        if old is None:
+            print(f"{stage:<16} {'-':>14} {seconds['median']:>13.4f}s")
+            continue
+        change = (seconds["median"] - old["median"]) / old["median"] * 100 if old["median"] else 0.0
+        print(f"{stage:<16} {old['median']:>13.4f}s {seconds['median']:>13.4f}s {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200_000, help="lines of chat text")
+    parser.add_argument("--multiline-ratio", type=float, default=0.1)
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--media-ratio", type=float, default=0.05)
+    parser.add_argument("--media-mix", type=json.loads,
+                        default={"IMG": 5, "STK": 2, "VID": 1, "PTT": 2, "DOC": 1, "VCF": 1},
+                        help='relative weight of every kind of attachment, as JSON, e.g. \'{"IMG": 1, "DOC": 1}\'')
+    parser.add_argument("--media-bytes", type=int, default=4096)
+    parser.add_argument("--format", default="android-us", help="chat format name, see chat_parser.CHAT_FORMATS")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="results file, defaults to benchmarks/results/pipeline-<commit>.json")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+    before = None
+    if args.compare:
+        # Read first, the new results may well overwrite the file.
+        with open(args.compare, "r", encoding="utf-8") as file:
+            before = json.load(file)
+
+    parameters = {"messages": args.messages, "multiline_ratio": args.multiline_ratio, "senders": args.senders,
+                  "media_ratio": args.media_ratio, "media_mix": args.media_mix, "media_bytes": args.media_bytes,
+                  "format": args.format, "seed": args.seed}
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep parse_archive from finding (or recording) earlier parses of the same chat.
+        chat_viewer.parse_cache.root = os.path.join(work_dir, "parse-cache")
+        archive = os.path.join(work_dir, "export.zip")
+        export = synthetic_export(archive, args.messages, args.multiline_ratio, args.seed, args.media_ratio,
+                                  args.format, args.senders, args.media_mix, args.media_bytes)
+        export["archive_bytes"] = os.path.getsize(archive)
+        for _ in range(args.repeat):
+            runs.append(time_stages(archive, work_dir))
+            chat_parser.parse_time.cache_clear()
+            chat_parser.get_chat_format(args.format).parse_date.cache_clear()
+
+    commit = git_commit()
+    stages = {stage: {"median": statistics.median(run[stage] for run in runs), "min": min(run[stage] for run in runs)}
+              for stage in runs[0]}
+    results = {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+               "cpus": os.cpu_count(), "parameters": parameters, "export": export, "repeat": args.repeat,
+               "stages": stages}
+
+    print(f"{export['lines']:,} lines, {export['attachments']:,} attachments, "
+          f"{export['archive_bytes'] / 2**20:.1f} MB archive, commit {commit}")
+    print(f"{'stage':<16} {'median':>10} {'min':>10}")
+    for stage, seconds in stages.items():
+        print(f"{stage:<16} {seconds['median']:>9.4f}s {seconds['min']:>9.4f}s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nwrote {output}")
+    if before is not None:
+        compare(results, before)
+
+
+if __name__ == "__main__":
+    main()
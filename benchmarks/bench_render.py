@@ -0,0 +1,83 @@
+"""
+Time to render a large chat with the old per-message string work in the template versus the precomputed
+Message records and templates/_messages.html.
+Run from the project root:
+    python -m benchmarks.bench_render
+"""
+import argparse
+import time
+
+from flask import render_template, render_template_string
+
+from chat_parser import organize_msgs, parse_chat
+from main import app
+from benchmarks.synthetic import synthetic_lines
+
+# The message loop as chat.html had it before messages were precomputed.
+LEGACY_TEMPLATE = """
+{% set ns = namespace(prev_date="None") %}
+{% for msg in messages %}
+    {% set ns2 = namespace(continue=True) %}
+    {% set msg_date = msg.date.strftime("%B %d, %Y") %}
+    {% if ns.prev_date != msg_date %}
+        <div class="system-message">{{ msg_date }}</div>
+        {% set ns.prev_date = msg_date %}
+    {% endif %}
+    {% if msg.type == 'info' %}
+        <div class="system-message">{{ msg.body | replace('\\n', '<br>') | safe }}</div>
+        {% set ns2.continue = False %}
+    {% endif %}
+    {% if ns2.continue %}
+        <div class="message {% if msg.name == username %}sent{% else %}received{% endif %}">
+            <span class="name {% if msg.name == username %}s{% else %}r{% endif %}">{{msg.name}}</span>
+            {% if msg.type == 'text' %}
+                {{ msg.body | replace('\\n', '<br>') | safe }}
+            {% elif msg.type == 'image' %}
+                <img src="{{ url_for('static', filename=media_root + msg.body.split('|')[0].strip(' ')) }}" width="200px">
+                <span>{{ msg.body.split('|')[1].strip(' ') }}</span>
+            {% elif msg.type == 'sticker' %}
+                <img src="{{ url_for('static', filename=media_root + msg.body.split('|')[0]) }}" width="100px">
+            {% elif msg.type == 'video' %}
+                <video controls width="200px">
+                    <source src="{{ url_for('static', filename=media_root + msg.body.split('|')[0].strip(' ')) }}" type="video/mp4">
+                    <span>{{ msg.body.split('|')[1].strip(' ') }}</span>
+                </video>
+            {% elif msg.type == 'audio' %}
+                <audio controls>
+                    <source src="{{ url_for('static', filename=media_root + msg.body.split('|')[0]) }}" type="audio/mpeg">
+                </audio>
+            {% endif %}
+            <span class="timestamp">{{ msg.time }}</span>
+            {% if msg.edited %}<span class="edited">Edited</span>{% endif %}
+        </div>
+    {% endif %}
+{% endfor %}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chat = parse_chat(organize_msgs(synthetic_lines(args.messages, multiline_ratio=0.1, media_ratio=0.1)))
+    legacy_chat = [{"date": msg.date, "time": msg.time, "name": msg.name, "body": msg.body, "type": msg.type,
+                    "edited": msg.edited} for msg in chat]
+    context = {"username": "Ada", "media_root": "chat-details/benchmark/", "chat_id": "0" * 32, "offset": 0}
+
+    with app.test_request_context():
+        for label, render in (
+            ("legacy template, dicts", lambda: render_template_string(LEGACY_TEMPLATE, messages=legacy_chat, **context)),
+            ("_messages.html, Message", lambda: render_template("_messages.html", messages=chat, **context)),
+        ):
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                render()
+                best = min(best, time.perf_counter() - start)
+            print(f"{label:<24} {best:>8.3f}s for {len(chat):,} messages ({len(chat) / best:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Index build time and query latency of SearchIndex on a large synthetic chat.
+Run from the project root:
+    python -m benchmarks.bench_search
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+from chat_parser import organize_msgs, parse_chat
+from search_index import SearchIndex
+from benchmarks.synthetic import synthetic_lines
+
+QUERIES = (
+    {"query": "wahala"},
+    {"query": "meeting tomorrow"},
+    {"query": "see you later fam"},
+    {"query": "abeg", "sender": "Tolu"},
+    {"query": "omo", "start": date(2023, 6, 1), "end": date(2023, 6, 30)},
+    {"start": date(2023, 6, 1), "end": date(2023, 6, 30)},
+    {"msg_type": "image", "sender": "Ada"},
+    {"query": "nowhere"},
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    chat = parse_chat(organize_msgs(synthetic_lines(args.messages, multiline_ratio=0, media_ratio=0.05)))
+    start = time.perf_counter()
+    index = SearchIndex(chat)
+    print(f"built index over {len(chat):,} messages in {time.perf_counter() - start:.2f}s, "
+          f"{len(index.postings):,} distinct tokens")
+
+    print(f"{'query':<60} {'matches':>9} {'median ms':>10} {'max ms':>8}")
+    for params in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            total, _ = index.search(**params)
+            timings.append((time.perf_counter() - start) * 1000)
+        label = ", ".join(f"{key}={value}" for key, value in params.items())
+        print(f"{label:<60} {total:>9,} {statistics.median(timings):>10.2f} {max(timings):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
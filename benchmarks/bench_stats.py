@@ -0,0 +1,60 @@
+"""
+Time to work out chat statistics from ChatColumns, with NumPy and with the standard library fallback, against a
+plain loop over a list of messages.
+Run from the project root:
+    python -m benchmarks.bench_stats
+"""
+import argparse
+import time
+from collections import Counter
+
+import chat_stats
+from chat_stats import ChatColumns
+from chat_parser import organize_msgs, parse_chat
+from benchmarks.synthetic import synthetic_lines
+
+
+def loop_stats(chat) -> dict:
+    """
+    The straightforward way: one Python loop over the messages, touching each one's attributes.
+    """
+    senders, types, hours, weekdays, edited = Counter(), Counter(), Counter(), Counter(), Counter()
+    for message in chat:
+        timestamp = message.timestamp
+        senders[message.name] += 1
+        types[message.type] += 1
+        hours[timestamp // 3600 % 24] += 1
+        weekdays[message.date.weekday()] += 1
+        edited[message.name] += message.edited
+    return {"senders": senders, "types": types, "hours": hours, "weekdays": weekdays, "edited": edited}
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    compact = parse_chat(organize_msgs(synthetic_lines(args.messages, multiline_ratio=0, media_ratio=0.05)))
+    chat = list(compact)
+    print(f"{len(chat):,} messages")
+    print(f"{'python loop over messages':<32} {timed(loop_stats, chat):>8.3f}s")
+    start = time.perf_counter()
+    columns = ChatColumns(chat)
+    print(f"{'build columns (once per chat)':<32} {time.perf_counter() - start:>8.3f}s")
+    if chat_stats.numpy is not None:
+        print(f"{'chat_stats, numpy':<32} {timed(chat_stats.chat_stats, columns):>8.3f}s")
+    numpy, chat_stats.numpy = chat_stats.numpy, None
+    print(f"{'chat_stats, standard library':<32} {timed(chat_stats.chat_stats, columns):>8.3f}s")
+    chat_stats.numpy = numpy
+    # A CompactChat already holds the columns, nothing to build.
+    print(f"{'chat_stats on CompactChat':<32} {timed(chat_stats.chat_stats, compact):>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Synthetic WhatsApp exports for the benchmarks.
+synthetic_lines mimics an export as read by find_and_read_chat_file, one str per line, by default from Android in the
+US locale; HEADERS has the other formats chat_parser.CHAT_FORMATS knows. synthetic_export writes a whole export ZIP,
+with a file for every attachment the chat mentions.
+"""
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+NAMES = ["Ada", "Tolu", "Kemi", "Manuel", "Zainab", "Chidi", "Ife", "Sola"]
+WORDS = ("lol", "abeg", "omo", "see", "you", "tomorrow", "the", "meeting", "is", "at", "what", "time",
+         "dey", "there", "no", "wahala", "I", "go", "call", "later", "fam", "this", "chat", "na", "cruise")
+
+
+MEDIA_PREFIXES = ("IMG", "STK", "VID", "PTT")
+# DOC attachments are PDFs and VCF ones contact cards, WhatsApp keeps their original names.
+MEDIA_EXTENSIONS = {"IMG": "jpg", "STK": "webp", "VID": "mp4", "PTT": "opus", "DOC": "pdf", "VCF": "vcf"}
+IOS_MEDIA_KINDS = {"IMG": "PHOTO", "STK": "STICKER", "VID": "VIDEO", "PTT": "AUDIO"}
+# First bytes of every kind of attachment, enough for chat_parser.sniff_file_type to recognize it.
+MEDIA_SIGNATURES = {
+    "IMG": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00",
+    "STK": b"RIFF\x00\x00\x00\x00WEBPVP8 ",
+    "VID": b"\x00\x00\x00\x18ftypmp42",
+    "PTT": b"OggS" + b"\x00" * 24 + b"OpusHead",
+    "DOC": b"%PDF-1.4\n",
+}
+
+
+def _sender_names(senders: int) -> list:
+    """
+    Returns the names of a chat's members, made up past the NAMES there are.
+    """
+    return NAMES[:senders] + [f"Member {number}" for number in range(len(NAMES) + 1, senders + 1)]
+
+
+def _attachment_name(prefix: str, index: int, stamp: datetime, ios: bool) -> str:
+    """
+    Returns the file name WhatsApp gives an attachment.
+    """
+    extension = MEDIA_EXTENSIONS[prefix]
+    if prefix == "DOC":
+        name = f"Report {index}.{extension}"
+    elif prefix == "VCF":
+        name = f"{NAMES[index % len(NAMES)]} {index}.{extension}"
+    elif ios:
+        return f"{index:08d}-{IOS_MEDIA_KINDS[prefix]}-{stamp:%Y-%m-%d-%H-%M-%S}.{extension}"
+    else:
+        return f"{prefix}-{stamp:%Y%m%d}-WA{index:04d}.{extension}"
+    return f"{index:08d}-{name}" if ios else name
+
+
+def _twelve_hour(stamp: datetime, seconds: bool = False) -> str:
+    time = f"{stamp.hour % 12 or 12}:{stamp:%M}"
+    return f"{time}:{stamp:%S}" if seconds else time
+
+
+# Message header of every format, by chat_parser.ChatFormat name.
+HEADERS = {
+    "android-us": lambda t: f"{t.month}/{t.day}/{t:%y}, {_twelve_hour(t)} {t:%p} - ",
+    "android-day-first": lambda t: f"{t:%d/%m/%Y}, {t:%H:%M} - ",
+    "android-day-first-12h": lambda t: f"{t:%d/%m/%Y}, {_twelve_hour(t)}\u202f{t:%p}".lower() + " - ",
+    "android-month-first-24h": lambda t: f"{t.month}/{t.day}/{t:%y}, {t:%H:%M} - ",
+    "android-dotted": lambda t: f"{t:%d.%m.%y}, {t:%H:%M} - ",
+    "ios": lambda t: f"[{t:%d/%m/%Y}, {t:%H:%M:%S}] ",
+    "ios-us": lambda t: f"[{t.month}/{t.day}/{t:%y}, {_twelve_hour(t, seconds=True)} {t:%p}] ",
+    "ios-day-first-12h": lambda t: f"[{t:%d/%m/%Y}, {_twelve_hour(t, seconds=True)} {t:%p}] ",
+    "ios-month-first-24h": lambda t: f"[{t.month}/{t.day}/{t:%y}, {t:%H:%M:%S}] ",
+    "ios-dotted": lambda t: f"[{t:%d.%m.%y}, {t:%H:%M:%S}] ",
+}
+
+
+def synthetic_lines(n_lines: int, multiline_ratio: float = 0.2, seed: int = 7, media_ratio: float = 0.0,
+                    chat_format: str = "android-us", senders: int = len(NAMES), media_mix: dict = None,
+                    attachments: list = None) -> list:
+    """
+    Builds a fake chat export with exactly n_lines lines.
+    Args:
+        n_lines (int): Number of lines to produce.
+        multiline_ratio (float): Share of lines that continue the previous message.
+        seed (int): Seed for the random generator so runs are comparable.
+        media_ratio (float): Share of messages that are attachments.
+        chat_format (str): Name of the export format to write, see HEADERS.
+        senders (int): Number of chat members.
+        media_mix (dict, optional): Relative weight of every kind of attachment, by MEDIA_EXTENSIONS prefix
+                                    (e.g. {"IMG": 6, "DOC": 1}). Defaults to images, stickers, videos and voice
+                                    notes alike.
+        attachments (list, optional): Gets a (file name, prefix) pair appended for every attachment written.
+    Returns:
+        lines (list of str): The export lines, each ending with a newline.
+    """
+    rng = random.Random(seed)
+    write_header = HEADERS[chat_format]
+    ios = chat_format.startswith("ios")
+    names = _sender_names(senders)
+    kinds, weights = zip(*media_mix.items()) if media_mix else (MEDIA_PREFIXES, None)
+    stamp = datetime(2023, 1, 1, 8, 0)
+    lines = []
+    while len(lines) < n_lines:
+        if lines and rng.random() < multiline_ratio:
+            lines.append(" ".join(rng.choices(WORDS, k=rng.randint(1, 12))) + "\n")
+            continue
+        stamp += timedelta(seconds=rng.randint(0, 600))
+        if rng.random() < media_ratio:
+            prefix = rng.choice(kinds) if weights is None else rng.choices(kinds, weights)[0]
+            file_name = _attachment_name(prefix, len(lines), stamp, ios)
+            body = f"\u200e<attached: {file_name}>" if ios else f"{file_name} (file attached)"
+            if attachments is not None:
+                attachments.append((file_name, prefix))
+        else:
+            body = " ".join(rng.choices(WORDS, k=rng.randint(1, 12)))
+        lines.append(f"{write_header(stamp)}{rng.choice(names)}: {body}\n")
+    return lines
+
+
+def synthetic_export(path: str, n_lines: int, multiline_ratio: float = 0.2, seed: int = 7,
+                     media_ratio: float = 0.05, chat_format: str = "android-us", senders: int = len(NAMES),
+                     media_mix: dict = None, media_bytes: int = 4096) -> dict:
+    """
+    Writes a fake WhatsApp export ZIP: the chat text from synthetic_lines and a file for every attachment in it.
+    The same arguments always give the same archive.
+    Args:
+        path (str): Where to write the ZIP.
+        n_lines, multiline_ratio, seed, media_ratio, chat_format, senders, media_mix: See synthetic_lines.
+        media_bytes (int): Size of every attachment but contact cards. Attachments are stored uncompressed, like
+                           the JPEG and MP4 files of real exports.
+    Returns:
+        dict: "lines", "attachments" (number of) and "chat_bytes" (size of the chat text).
+    """
+    attachments = []
+    lines = synthetic_lines(n_lines, multiline_ratio, seed, media_ratio, chat_format, senders, media_mix, attachments)
+    text = "".join(lines).encode("utf-8")
+    rng = random.Random(seed)
+    chat_name = "_chat.txt" if chat_format.startswith("ios") else f"WhatsApp Chat with {NAMES[0]}.txt"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(chat_name, text, compress_type=zipfile.ZIP_DEFLATED)
+        for file_name, prefix in attachments:
+            if prefix == "VCF":
+                number = f"+234 80{rng.randrange(10**8):08d}"
+                content = f"BEGIN:VCARD\nVERSION:3.0\nFN:{file_name[:-4]}\nTEL;type=CELL:{number}\nEND:VCARD\n"
+                archive.writestr(file_name, content)
+                continue
+            signature = MEDIA_SIGNATURES[prefix]
+            archive.writestr(file_name, signature + rng.randbytes(max(media_bytes - len(signature), 0)))
+    return {"lines": len(lines), "attachments": len(attachments), "chat_bytes": len(text)}
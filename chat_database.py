@@ -0,0 +1,277 @@
+import os
+import sqlite3
+import threading
+from array import array
+from collections.abc import Sequence
+from datetime import date, datetime
+
+from chat_parser import EPOCH_ORDINAL, Message, iter_chunks
+from search_index import tokenize
+
+# Messages are stored in chat order with their offset as rowid, so a window of the chat is a primary key range.
+# Senders and types are interned in small tables, like CompactChat does. The full text index is contentless: it
+# only holds the index, the text is already in 'messages'.
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+CREATE TABLE senders (code INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE types (code INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE days (day INTEGER NOT NULL, start INTEGER NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    sender INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    edited INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+"""
+# Built once the messages are in, which is much faster than keeping them up to date row by row.
+INDEXES = """
+CREATE INDEX messages_timestamp ON messages (timestamp);
+CREATE INDEX messages_sender ON messages (sender, id);
+CREATE INDEX messages_type ON messages (type, id);
+"""
+# Folds case and strips accents like search_index.tokenize, so both backends match the same words.
+FULL_TEXT_INDEX = ("CREATE VIRTUAL TABLE messages_fts USING fts5(name, body, content='', "
+                   "tokenize='unicode61 remove_diacritics 2')")
+SCHEMA_VERSION = 1
+
+
+def _has_fts5(connection: sqlite3.Connection) -> bool:
+    """
+    Checks whether this build of SQLite has the FTS5 extension.
+    """
+    return bool(connection.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+def write_chat_database(chat, path: str, batch_size: int = 10_000):
+    """
+    Writes a parsed chat into a new SQLite file, replacing any file already there.
+    The file is built under a temporary name and moved into place, so readers never see half a database.
+    Args:
+        chat (CompactChat): The parsed chat, as parse_chat returns it.
+        path (str): The database file.
+        batch_size (int, optional): Messages inserted per executemany and transaction. Defaults to 10,000.
+    """
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    if os.path.exists(partial):
+        os.remove(partial)
+    connection = sqlite3.connect(partial, isolation_level=None)
+    try:
+        # Nothing to recover from a crash mid-way, the partial file is just thrown away.
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+        full_text = _has_fts5(connection)
+        if full_text:
+            connection.execute(FULL_TEXT_INDEX)
+        connection.execute("BEGIN")
+        connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                               [("version", SCHEMA_VERSION), ("count", len(chat)), ("full_text", int(full_text))])
+        connection.executemany("INSERT INTO senders VALUES (?, ?)", enumerate(chat.senders))
+        connection.executemany("INSERT INTO types VALUES (?, ?)", enumerate(chat.types))
+        connection.executemany("INSERT INTO days VALUES (?, ?, ?)",
+                               ((day.toordinal() - EPOCH_ORDINAL, start, count) for day, start, count in chat.days()))
+        connection.execute("COMMIT")
+
+        times, odd_times, senders = chat.times, chat.odd_times, chat.senders
+        bodies, offsets = chat.bodies, chat.body_offsets
+        rows = ((index, timestamp, odd_times.get(index) or times[timestamp % 86400], sender, msg_type, edited,
+                 bodies[offsets[index]:offsets[index + 1]].decode("utf-8"))
+                for index, (timestamp, sender, msg_type, edited)
+                in enumerate(zip(chat.timestamps, chat.sender_codes, chat.type_codes, chat.edited)))
+        for batch in iter_chunks(rows, batch_size):
+            connection.execute("BEGIN")
+            connection.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            if full_text:
+                connection.executemany("INSERT INTO messages_fts (rowid, name, body) VALUES (?, ?, ?)",
+                                       ((row[0], senders[row[3]] or "", row[6]) for row in batch))
+            connection.execute("COMMIT")
+        connection.executescript(INDEXES)
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    os.replace(partial, path)
+
+
+class DatabaseColumns:
+    """
+    The columns chat_stats works on, read out of a chat database in a single pass.
+
+    Attributes:
+        senders (list): Sender names by code. Code 0 is None, the "sender" of info messages.
+        types (list of str): Message types by code.
+        timestamps (array): Seconds since 1970-01-01 (chat local time) of every message.
+        sender_codes (array): Sender code of every message.
+        type_codes (array): Type code of every message.
+        edited (array): 1 for every edited message, 0 otherwise.
+    """
+
+    def __init__(self, senders: list, types: list, rows):
+        self.senders = senders
+        self.types = types
+        self.timestamps = array("q")
+        self.sender_codes = array("I")
+        self.type_codes = array("B")
+        self.edited = array("B")
+        for timestamp, sender, msg_type, edited in rows:
+            self.timestamps.append(timestamp)
+            self.sender_codes.append(sender)
+            self.type_codes.append(msg_type)
+            self.edited.append(edited)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class ChatDatabase(Sequence):
+    """
+    A parsed chat kept in a SQLite file written by write_chat_database, rather than in memory.
+    Windows of messages, sender names, the day index and searches are all indexed queries, so serving a page
+    takes the same time however long the chat is, and every worker process can open the same file.
+    Indexing (and slicing, and iterating) gives back Message objects, so it can stand in for a CompactChat.
+
+    Attributes:
+        path (str): The database file.
+        senders (list): Sender names by code. Code 0 is None, the "sender" of info messages.
+        types (list of str): Message types by code.
+        full_text (bool): Whether the file has an FTS5 index of the messages, searches scan the messages without.
+    """
+    # Messages fetched per query while iterating over the whole chat.
+    BATCH_SIZE = 5000
+
+    def __init__(self, path: str):
+        """
+        Opens a chat database read-only.
+        Args:
+            path (str): The database file.
+        Raises:
+            sqlite3.DatabaseError: If the file isn't a chat database of this version.
+        """
+        self.path = path
+        # One connection shared by the request threads, queries take turns on it.
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._query("SELECT key, value FROM meta"))
+        if meta.get("version") != SCHEMA_VERSION:
+            self._connection.close()
+            raise sqlite3.DatabaseError(f"{path} isn't a version {SCHEMA_VERSION} chat database")
+        self._count = meta["count"]
+        self.full_text = bool(meta["full_text"])
+        self.senders = [name for _, name in self._query("SELECT code, name FROM senders ORDER BY code")]
+        self.types = [name for _, name in self._query("SELECT code, name FROM types ORDER BY code")]
+        self._type_codes = {msg_type: code for code, msg_type in enumerate(self.types)}
+        self._sender_codes = {name: code for code, name in enumerate(self.senders)}
+
+    def _query(self, sql: str, parameters=()) -> list:
+        """
+        Runs a query and returns all its rows.
+        """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        """
+        Returns the message at an index, or a list of the messages in a slice.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step == 1:
+                return self._fetch(start, max(stop, start))
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("message index out of range")
+        return self._fetch(index, index + 1)[0]
+
+    def __iter__(self):
+        for start in range(0, self._count, self.BATCH_SIZE):
+            yield from self._fetch(start, min(start + self.BATCH_SIZE, self._count))
+
+    def _fetch(self, start: int, stop: int) -> list:
+        """
+        Reads the messages from index 'start' up to 'stop', both valid and non-negative.
+        """
+        if start >= stop:
+            return []
+        # The message before the window tells whether the first one starts a new day.
+        rows = self._query("SELECT id, timestamp, time, sender, type, edited, body FROM messages "
+                           "WHERE id >= ? AND id < ? ORDER BY id", (max(start - 1, 0), stop))
+        previous_day = rows[0][1] // 86400 if start else None
+        messages = []
+        for index, timestamp, time, sender, msg_type, edited, body in rows:
+            day = timestamp // 86400
+            if index >= start:
+                messages.append(Message(datetime.fromordinal(day + EPOCH_ORDINAL), time, self.senders[sender], body,
+                                        self.types[msg_type], bool(edited), day != previous_day))
+            previous_day = day
+        return messages
+
+    def days(self) -> list:
+        """
+        Returns the day index of the chat, see CompactChat.days.
+        """
+        return [(date.fromordinal(day + EPOCH_ORDINAL), start, count)
+                for day, start, count in self._query("SELECT day, start, count FROM days ORDER BY start")]
+
+    def columns(self) -> DatabaseColumns:
+        """
+        Reads the columns chat_stats needs, without the message bodies.
+        """
+        return DatabaseColumns(self.senders, self.types,
+                               self._query("SELECT timestamp, sender, type, edited FROM messages ORDER BY id"))
+
+    def search(self, query: str = "", sender: str = None, msg_type: str = None, start=None, end=None,
+               limit: int = 50) -> tuple:
+        """
+        Finds the messages containing every word of a query, the same way SearchIndex.search does.
+        Args:
+            query (str, optional): Words to look for, in the body or the sender's name. Empty matches every message.
+            sender (str, optional): Only messages sent by this exact name.
+            msg_type (str, optional): Only messages of this type, e.g. "image".
+            start (date, optional): Only messages on or after this date.
+            end (date, optional): Only messages on or before this date.
+            limit (int, optional): Most offsets to return. Defaults to 50.
+        Returns:
+            tuple: The number of matching messages and the offsets of the first 'limit' of them, in chat order.
+        """
+        conditions, parameters = [], []
+        tokens = sorted(set(tokenize(query)))
+        if tokens and self.full_text:
+            conditions.append("id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            parameters.append(" AND ".join(f'"{token}"' for token in tokens))
+        elif tokens:
+            # LIKE folds ASCII case only, close enough for the rare SQLite built without FTS5.
+            for token in tokens:
+                conditions.append("(body LIKE ? ESCAPE '\\' OR sender IN (SELECT code FROM senders WHERE name LIKE ? "
+                                  "ESCAPE '\\'))")
+                pattern = "%" + token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                parameters += [pattern, pattern]
+        if sender is not None:
+            conditions.append("sender = ?")
+            parameters.append(self._sender_codes.get(sender, -1))
+        if msg_type is not None:
+            conditions.append("type = ?")
+            parameters.append(self._type_codes.get(msg_type, -1))
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append((start.toordinal() - EPOCH_ORDINAL) * 86400)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            parameters.append((end.toordinal() + 1 - EPOCH_ORDINAL) * 86400)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        total = self._query(f"SELECT COUNT(*) FROM messages{where}", parameters)[0][0]
+        offsets = self._query(f"SELECT id FROM messages{where} ORDER BY id LIMIT ?", parameters + [max(limit, 0)])
+        return total, [offset for offset, in offsets]
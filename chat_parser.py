@@ -0,0 +1,1157 @@
+import fnmatch
+import hashlib
+import io
+import mimetypes
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import threading
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import chain, islice
+from zipfile import ZipFile
+
+from markupsafe import Markup, escape
+
+
+class TamperedFileError(Exception):
+    """
+    Custom exception for handling improperly structured files.
+    Raised when a file does not follow the expected format.
+    """
+
+    def __init__(self, message="What kinda file is this fam?"):
+        """
+        Initializes the exception with a default or custom error message.
+        Args:
+            message (str, optional): The error message to display. Defaults to a casual phrasing.
+        """
+        super().__init__(message)
+
+
+@lru_cache(maxsize=4096)
+def day_label(date: datetime) -> str:
+    """
+    Formats a date the way the chat view shows it above each day's messages, e.g. "January 02, 2023".
+    Args:
+        date (datetime): The date to format.
+    Returns:
+        str: The formatted date, computed once per distinct date.
+    """
+    return date.strftime("%B %d, %Y")
+
+
+class Message:
+    """
+    A parsed chat message, with everything the chat view shows worked out once at parse time.
+
+    Attributes:
+        date (datetime): The date of the message.
+        time (str): The time the message was sent.
+        name (str or None): The sender's name, None for "info" messages.
+        body (str): The message content, attachments are written as "<file name>|<caption>".
+        type (str): The type of message, see iter_parse_chat.
+        edited (bool): Whether the message was edited.
+        new_day (bool): Whether this is the first message of its day.
+        day_label (str): The date as shown above each day's messages.
+        media (str or None): File name of the attachment, for media, pdf and document messages.
+        title (str or None): The contact's name, for contact messages.
+        caption (str): Image or video caption, or the contact's phone number.
+    """
+    __slots__ = ("date", "time", "name", "body", "type", "edited", "new_day", "day_label", "media", "title", "caption")
+
+    MEDIA_TYPES = frozenset({"image", "sticker", "video", "audio", "pdf", "document"})
+
+    def __init__(self, date: datetime, time: str, name, body: str, type: str, edited: bool = False,
+                 new_day: bool = False):
+        """
+        Initializes the message and works out its display fields.
+        """
+        self.date = date
+        self.time = time
+        self.name = name
+        self.body = body
+        self.type = type
+        self.edited = edited
+        self.new_day = new_day
+        self.day_label = day_label(date)
+        self.media = None
+        self.title = None
+        self.caption = ""
+        if type in self.MEDIA_TYPES:
+            parts = body.split("|")
+            self.media = parts[0].strip(" ")
+            if type in ("image", "video") and len(parts) > 1:
+                self.caption = parts[1].strip(" ")
+        elif type == "contact":
+            self.title, _, self.caption = body.partition("|")
+
+    def __getstate__(self):
+        """
+        Pickles the message as a plain tuple of its fields, which is much smaller than the default per-field dict.
+        """
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        """
+        Restores a message pickled by __getstate__.
+        """
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    @property
+    def timestamp(self) -> int:
+        """
+        When the message was sent, as seconds since 1970-01-01 in the chat's own (local) time.
+        """
+        return (self.date.toordinal() - EPOCH_ORDINAL) * 86400 + parse_time(self.time)
+
+    @property
+    def html(self) -> Markup:
+        """
+        The body escaped for HTML with line breaks kept, for text and info messages.
+        """
+        return escape(self.body).replace("\n", Markup("<br>"))
+
+    def to_dict(self) -> dict:
+        """
+        Converts the message to plain JSON types.
+        Returns:
+            dict: The message fields, with the date as an ISO formatted string.
+        """
+        return {"date": self.date.date().isoformat(), "time": self.time, "name": self.name, "body": self.body,
+                "type": self.type, "edited": self.edited, "new_day": self.new_day, "day_label": self.day_label,
+                "media": self.media, "title": self.title, "caption": self.caption}
+
+
+class CompactChat(Sequence):
+    """
+    A parsed chat packed into columns, instead of one Message object per message.
+    Senders, types and times are interned in small tables and referred to by code, timestamps and codes live in
+    packed arrays, and all message bodies share one UTF-8 buffer cut up by offsets. Dates, day labels, new_day and
+    the media fields are worked out again from these when a message is read.
+    Indexing (and slicing, and iterating) gives back Message objects, so it can stand in for a list of messages.
+
+    Attributes:
+        senders (list): Sender names by code. Code 0 is None, the "sender" of info messages.
+        types (list of str): Message types by code.
+        timestamps (array): Seconds since 1970-01-01 (chat local time) of every message, see Message.timestamp.
+        sender_codes (array): Sender code of every message.
+        type_codes (array): Type code of every message.
+        edited (array): 1 for every edited message, 0 otherwise.
+        times (dict): Time of day, in seconds, to the time string messages sent then show.
+        odd_times (dict): Index to time string of the few messages whose time string doesn't match 'times'.
+        bodies (bytearray): Every message body, encoded as UTF-8, one after the other.
+        body_offsets (array): Where each message's body starts in 'bodies', plus where the last one ends.
+        day_numbers (array): Day (since 1970-01-01) of every run of messages sent on the same day, in chat order.
+                             A run starts wherever a message has new_day set.
+        day_starts (array): Index of the first message of every run in 'day_numbers'.
+    """
+
+    def __init__(self, messages=()):
+        """
+        Packs messages into a new chat.
+        Args:
+            messages (iterable of Message or CompactChat, optional): The messages, in chat order.
+        """
+        self.senders = [None]
+        self.types = []
+        self.timestamps = array("q")
+        self.sender_codes = array("H")
+        self.type_codes = array("B")
+        self.edited = array("B")
+        self.times = {}
+        self.odd_times = {}
+        self.bodies = bytearray()
+        self.body_offsets = array("Q", [0])
+        self.day_numbers = array("q")
+        self.day_starts = array("Q")
+        self._lookups()
+        self.extend(messages)
+
+    def _lookups(self):
+        """
+        Builds the value to code lookups of the sender and type tables.
+        """
+        self._sender_codes = {name: code for code, name in enumerate(self.senders)}
+        self._type_codes = {msg_type: code for code, msg_type in enumerate(self.types)}
+
+    @staticmethod
+    def _intern(table: list, codes: dict, value) -> int:
+        """
+        Returns the code of a value in a table, adding it to the table if it's new.
+        """
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(table)
+            table.append(value)
+        return code
+
+    def append(self, message: Message):
+        """
+        Adds a message to the end of the chat.
+        Args:
+            message (Message): The message.
+        """
+        timestamp = message.timestamp
+        if self.times.setdefault(timestamp % 86400, message.time) != message.time:
+            self.odd_times[len(self.timestamps)] = message.time
+        day = timestamp // 86400
+        if not self.day_numbers or self.day_numbers[-1] != day:
+            self.day_numbers.append(day)
+            self.day_starts.append(len(self.timestamps))
+        self.timestamps.append(timestamp)
+        self.sender_codes.append(self._intern(self.senders, self._sender_codes, message.name))
+        self.type_codes.append(self._intern(self.types, self._type_codes, message.type))
+        self.edited.append(message.edited)
+        self.bodies += message.body.encode("utf-8")
+        self.body_offsets.append(len(self.bodies))
+
+    def extend(self, messages):
+        """
+        Adds messages to the end of the chat.
+        Args:
+            messages (iterable of Message or CompactChat): The messages. Another CompactChat is merged column by
+                                                           column, without unpacking its messages.
+        """
+        if not isinstance(messages, CompactChat):
+            for message in messages:
+                self.append(message)
+            return
+        base = len(self.timestamps)
+        senders = [self._intern(self.senders, self._sender_codes, name) for name in messages.senders]
+        types = [self._intern(self.types, self._type_codes, msg_type) for msg_type in messages.types]
+        self.sender_codes.extend(map(senders.__getitem__, messages.sender_codes))
+        self.type_codes.extend(map(types.__getitem__, messages.type_codes))
+        clashes = {seconds for seconds, time in messages.times.items() if self.times.setdefault(seconds, time) != time}
+        if clashes:
+            for index, timestamp in enumerate(messages.timestamps):
+                if timestamp % 86400 in clashes:
+                    self.odd_times[base + index] = messages.times[timestamp % 86400]
+        self.odd_times.update((base + index, time) for index, time in messages.odd_times.items())
+        # A day cut in two by the end of this chat and the start of the other is one run.
+        skip = 1 if self.day_numbers and messages.day_numbers and self.day_numbers[-1] == messages.day_numbers[0] else 0
+        self.day_numbers.extend(islice(messages.day_numbers, skip, None))
+        self.day_starts.extend(map(base.__add__, islice(messages.day_starts, skip, None)))
+        self.timestamps.extend(messages.timestamps)
+        self.edited.extend(messages.edited)
+        shift = len(self.bodies)
+        self.bodies += messages.bodies
+        self.body_offsets.extend(map(shift.__add__, islice(messages.body_offsets, 1, None)))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        """
+        Returns the message at an index, or a list of the messages in a slice.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.timestamps))
+            if step == 1:
+                return list(self._unpack(start, max(stop, start)))
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self.timestamps)
+        if not 0 <= index < len(self.timestamps):
+            raise IndexError("message index out of range")
+        return next(self._unpack(index, index + 1))
+
+    def __iter__(self):
+        return self._unpack(0, len(self.timestamps))
+
+    def _unpack(self, start: int, stop: int):
+        """
+        Unpacks the messages from index 'start' up to 'stop', both valid and non-negative.
+        """
+        senders, types, times, odd_times = self.senders, self.types, self.times, self.odd_times
+        timestamps, sender_codes, type_codes, edited = self.timestamps, self.sender_codes, self.type_codes, self.edited
+        bodies, offsets = self.bodies, self.body_offsets
+        previous_day = timestamps[start - 1] // 86400 if start else None
+        for index in range(start, stop):
+            timestamp = timestamps[index]
+            day = timestamp // 86400
+            yield Message(datetime.fromordinal(day + EPOCH_ORDINAL), odd_times.get(index) or times[timestamp % 86400],
+                          senders[sender_codes[index]], bodies[offsets[index]:offsets[index + 1]].decode("utf-8"),
+                          types[type_codes[index]], bool(edited[index]), day != previous_day)
+            previous_day = day
+
+    def days(self) -> list:
+        """
+        Returns the day index of the chat, to jump to a date without going through the messages before it.
+        Returns:
+            list of tuple: (date, offset of the day's first message, number of messages that day), for every run of
+                           messages sent on the same day, in chat order. Exports are in date order, so a date
+                           normally has a single run.
+        """
+        ends = chain(islice(self.day_starts, 1, None), (len(self.timestamps),))
+        return [(date.fromordinal(day + EPOCH_ORDINAL), start, end - start)
+                for day, start, end in zip(self.day_numbers, self.day_starts, ends)]
+
+    def nbytes(self) -> int:
+        """
+        Returns roughly how much memory the chat takes: its columns, tables and the strings in them.
+        """
+        columns = (self.timestamps, self.sender_codes, self.type_codes, self.edited, self.bodies, self.body_offsets,
+                   self.day_numbers, self.day_starts, self.senders, self.types, self.times, self.odd_times)
+        strings = chain(self.senders, self.types, self.times.values(), self.odd_times.values())
+        return sum(map(sys.getsizeof, columns)) + sum(map(sys.getsizeof, strings))
+
+    def __getstate__(self):
+        """
+        Pickles the columns, leaving out the lookups that can be built again from the tables.
+        """
+        state = self.__dict__.copy()
+        del state["_sender_codes"], state["_type_codes"]
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores a chat pickled by __getstate__.
+        """
+        self.__dict__.update(state)
+        self._lookups()
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+TIME_PATTERN = re.compile(r"(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?\s*([AaPp])?")
+# (offset, signature, extension) of the file types attachments are sniffed as, checked in order.
+FILE_SIGNATURES = (
+    (0, b"%PDF", ".pdf"),
+    (0, b"PK\x03\x04", ".zip"),  # Also DOCX, XLSX and PPTX, told apart in sniff_file_type
+    (0, b"PK\x05\x06", ".zip"),  # Empty ZIP
+    (0, b"PK\x07\x08", ".zip"),  # Spanned ZIP
+    (0, b"\xD0\xCF\x11\xE0", ".doc"),  # Older Office formats
+    (8, b"WEBP", ".webp"),
+    (0, b"OggS", ".ogg"),  # Opus voice notes are told apart in sniff_file_type
+    (0, b"\xFF\xD8\xFF", ".jpg"),
+    (0, b"\x89PNG", ".png"),
+    (0, b"GIF8", ".gif"),
+    (4, b"ftyp", ".mp4"),
+    (0, b"ID3", ".mp3"),
+    (0, b"BEGIN:VCARD", ".vcf"),
+)
+# The message type of attachments whose sniffed extension is a kind of media, whatever their name says.
+SNIFFED_MESSAGE_TYPES = {
+    ".jpg": "image", ".png": "image", ".gif": "image", ".webp": "image",
+    ".mp4": "video",
+    ".opus": "audio", ".ogg": "audio", ".mp3": "audio",
+}
+# Every uploaded chat is extracted into its own sub-directory of this one. It's outside the static folder, so
+# nothing in it is served except through the chat routes, which check the chat ID and the file name.
+CHAT_DETAILS_DIR = "instance/chat-details"
+# Superset of the dates accepted by strptime's "%m/%d/%y", used to skip strptime for non-date text.
+DATE_PATTERN = re.compile(r"\d{1,2}/ ?\d{1,2}/\d{2}")
+# The numbers of a date in any of the chat formats, in the order they're written.
+DATE_PARTS_PATTERN = re.compile(r"(\d{1,2})\D(\d{1,2})\D(\d{2,4})")
+TWELVE_HOUR_TIME = r"\d{1,2}[:.]\d{2}(?:[:.]\d{2})?\s?[AaPp]\.?\s?[Mm]\.?"
+TWENTY_FOUR_HOUR_TIME = r"\d{1,2}[:.]\d{2}(?:[:.]\d{2})?"
+# iOS writes attachments as "<attached: 00000012-PHOTO-2023-01-02-21-15-07.jpg>", with the kind of media in the name.
+IOS_ATTACHMENT_PATTERN = re.compile(r"\u200e?<attached: (?P<file>(?:\d+-(?P<kind>[A-Z]+)-)?[^>]*)>")
+# The Android file name prefix each kind of iOS attachment is treated as.
+IOS_MEDIA_KINDS = {"PHOTO": "IMG", "STICKER": "STK", "AUDIO": "PTT", "VIDEO": "VID", "GIF": "VID"}
+# Lines looked at to work out which format a chat export is in.
+FORMAT_SAMPLE_LINES = 1000
+
+
+class ChatFormat:
+    """
+    One of the ways WhatsApp writes the header of a message, which depends on the app (Android or iOS) and the
+    phone's locale, e.g. "1/2/23, 9:15 PM - Ada: hi" or "[02/01/2023, 21:15:07] Ada: hi".
+    Each format is a pair of regular expressions compiled once, so a line is checked or split with a single match.
+
+    Attributes:
+        name (str): Identifies the format, e.g. "android-us".
+        layout (str): "android" or "ios".
+        day_first (bool): Whether dates are written day/month/year rather than month/day/year.
+        start (re.Pattern): Matches the header at the start of a line, capturing "date" and "time".
+        header (re.Pattern): Matches a whole message, capturing "date", "time", "name" (None for system messages)
+                             and "body".
+    """
+
+    def __init__(self, name: str, layout: str, separator: str, twelve_hour: bool, day_first: bool):
+        """
+        Compiles the format's patterns.
+        Args:
+            name (str): Identifies the format.
+            layout (str): "android" for "<date>, <time> - ", "ios" for "[<date>, <time>] ".
+            separator (str): What's between the numbers of a date, "/" or ".".
+            twelve_hour (bool): Whether times have AM/PM.
+            day_first (bool): Whether dates are day/month/year.
+        """
+        self.name = name
+        self.layout = layout
+        self.day_first = day_first
+        date = rf"\d{{1,2}}{re.escape(separator)}\d{{1,2}}{re.escape(separator)}\d{{2}}(?:\d{{2}})?"
+        time = TWELVE_HOUR_TIME if twelve_hour else TWENTY_FOUR_HOUR_TIME
+        if layout == "ios":
+            prefix = rf"\u200e?\[(?P<date>{date}), (?P<time>{time})\] "
+        else:
+            prefix = rf"(?P<date>{date}), (?P<time>{time}) - "
+        self.start = re.compile(prefix)
+        self.header = re.compile(prefix + r"(?:(?P<name>[^\n]*?): )?(?P<body>.*)", re.DOTALL)
+        # Most messages in a chat share a handful of dates, each distinct one is only parsed once.
+        self.parse_date = lru_cache(maxsize=4096)(self._parse_date)
+
+    def _parse_date(self, date: str) -> datetime:
+        """
+        Converts a date written in this format to a datetime.
+        Args:
+            date (str): The date, as captured by 'start' or 'header'.
+        Returns:
+            datetime: The date.
+        Raises:
+            ValueError: If it isn't a valid date.
+        """
+        first, second, year = map(int, DATE_PARTS_PATTERN.fullmatch(date).groups())
+        if year < 100:
+            # Same pivot as strptime's %y.
+            year += 2000 if year < 69 else 1900
+        day, month = (first, second) if self.day_first else (second, first)
+        return datetime(year, month, day)
+
+    def is_message_start(self, line: str) -> bool:
+        """
+        Checks if a line starts a new message, rather than continuing the one before it.
+        Args:
+            line (str): A line of the chat file.
+        Returns:
+            bool: True if the line starts with a header in this format with a valid date.
+        """
+        match = self.start.match(line)
+        if match is None:
+            return False
+        try:
+            self.parse_date(match.group("date"))
+        except ValueError:
+            return False
+        return True
+
+    def __reduce__(self):
+        # Formats are module level constants, worker processes look them up by name rather than unpickling caches.
+        return get_chat_format, (self.name,)
+
+    def __repr__(self) -> str:
+        return f"ChatFormat({self.name!r})"
+
+
+# Every format the parser knows, in order of preference for chats that fit more than one (all dates could be read
+# either way round). Twelve hour clocks lean month-first (US), twenty-four hour clocks day-first.
+CHAT_FORMATS = (
+    ChatFormat("android-us", "android", "/", twelve_hour=True, day_first=False),
+    ChatFormat("android-day-first", "android", "/", twelve_hour=False, day_first=True),
+    ChatFormat("android-day-first-12h", "android", "/", twelve_hour=True, day_first=True),
+    ChatFormat("android-month-first-24h", "android", "/", twelve_hour=False, day_first=False),
+    ChatFormat("android-dotted", "android", ".", twelve_hour=False, day_first=True),
+    ChatFormat("ios", "ios", "/", twelve_hour=False, day_first=True),
+    ChatFormat("ios-us", "ios", "/", twelve_hour=True, day_first=False),
+    ChatFormat("ios-day-first-12h", "ios", "/", twelve_hour=True, day_first=True),
+    ChatFormat("ios-month-first-24h", "ios", "/", twelve_hour=False, day_first=False),
+    ChatFormat("ios-dotted", "ios", ".", twelve_hour=False, day_first=True),
+)
+
+
+def delete_directory(dir_path):
+    """
+    Deletes a directory and all its contents.
+    Args:
+        dir_path (str): The path to the directory.
+    Returns:
+        None
+    """
+    try:
+        shutil.rmtree(dir_path)
+        print(f"Deleted directory and its contents: {dir_path}")
+    except FileNotFoundError:
+        print(f"Directory not found: {dir_path}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def extract_zipfile(file, path=CHAT_DETAILS_DIR):
+    """
+    Extracts the contents of a ZIP file into a chat details directory.
+    Args:
+        file (str or file-like object): The ZIP file to be extracted.
+        path (str, optional): The directory to extract into, cleared first. Defaults to 'instance/chat-details'.
+    Returns:
+        None
+    """
+    # Clear files left in the chat details directory.
+    delete_directory(path)
+    # Extract zipfile
+    with ZipFile(file, 'r') as zObject:
+        # Extracting all the members of the zip
+        # into a specific location.
+        zObject.extractall(path=path)
+
+
+def get_files_by_extension(directory, extension):
+    """
+    Returns a list of files matching the extension in the directory..
+    Args:
+        directory (str): Directory to search for files.
+        extension (str): file extension to search for.
+    """
+    return [f for f in os.listdir(directory) if fnmatch.fnmatch(f, f"*{extension}")]
+
+
+def sniff_file_type(head: bytes):
+    """
+    Works out a file's type from its first bytes.
+    Args:
+        head (bytes): The start of the file, the first 4KB is plenty.
+    Returns:
+        str or None: The matching file extension (e.g., ".pdf"), or None if the signature isn't known.
+    """
+    for offset, signature, ext in FILE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if ext == ".zip":
+                # Office documents are ZIP files too, tell them apart by the folders near the start of the archive.
+                for folder, office_ext in ((b"word/", ".docx"), (b"xl/", ".xlsx"), (b"ppt/", ".pptx")):
+                    if folder in head:
+                        return office_ext
+            elif ext == ".ogg" and head[28:36] == b"OpusHead":
+                return ".opus"
+            return ext
+    return None
+
+
+def sniff_mimetype(path: str):
+    """
+    Works out the MIME type of a file whose name doesn't tell it, e.g. attachments without an extension.
+    Args:
+        path (str): The file.
+    Returns:
+        str or None: The MIME type of its sniffed extension, or None if the signature isn't known.
+    Raises:
+        OSError: If the file can't be read.
+    """
+    with open(path, "rb") as file:
+        extension = sniff_file_type(file.read(AttachmentCatalog.HEAD_SIZE))
+    return mimetypes.guess_type(f"file{extension}")[0] if extension else None
+
+
+def get_names(parsed_chat) -> list:
+    """
+    Extracts all unique names from a parsed WhatsApp chat dictionary.
+    Args:
+        parsed_chat (CompactChat, ChatDatabase or list of Message): A parsed chat.
+    Returns:
+        list: A sorted list of unique names found in the chat.
+    """
+    senders = getattr(parsed_chat, "senders", None)
+    if senders is not None:
+        # The senders are already in a table, no need to unpack every message.
+        return sorted(name for name in senders if name is not None)
+    return sorted({chat.name for chat in parsed_chat if chat.name is not None})
+
+
+def parse_vcard(vcf_content: str) -> str:
+    """
+    Extracts the contact name and phone number from the content of a VCF (vCard) file.
+    Args:
+        vcf_content (str): The text of the VCF file.
+    Returns:
+        str: The extracted contact details in the format "Name|PhoneNumber",
+             or "|" if extraction fails.
+    """
+    # Extract name and number using regex
+    fn_match = re.search(r"FN:(.+)", vcf_content)
+    tel_match = re.search(r"TEL;type=.*?:\+?([\d\s]+)", vcf_content)
+
+    if tel_match and fn_match:
+        phone_number = tel_match.group(1).replace(" ", "").strip("\n")
+        phone_number = "0" + phone_number[3:]
+        return f"{fn_match.group(1)}|{phone_number}"
+    else:
+        return "|"
+
+
+class AttachmentCatalog:
+    """
+    Everything parse_chat needs to know about a chat's attachments, gathered in one pass over the archive.
+
+    Every member's type is sniffed from its first bytes and every vCard is parsed up front, so parsing the chat
+    only does dictionary lookups.
+
+    Attributes:
+        extensions (dict): Member name to the extension its content was sniffed as (or None if unknown).
+        contacts (dict): VCF member name to its contact details, as "Name|PhoneNumber".
+    """
+    HEAD_SIZE = 4096
+
+    def __init__(self, zObject: ZipFile = None):
+        """
+        Builds the catalog from an open archive, or an empty one if no archive is given.
+        Args:
+            zObject (ZipFile, optional): The chat's archive.
+        """
+        self.extensions = {}
+        self.contacts = {}
+        self._stems = {}
+        if zObject is None:
+            return
+        for info in zObject.infolist():
+            if info.is_dir() or "/" in info.filename:
+                continue
+            name = info.filename
+            with zObject.open(info) as member:
+                if name.lower().endswith(".vcf"):
+                    vcf_content = member.read().decode("utf-8", errors="replace").replace("\r\n", "\n")
+                    self.contacts[name] = parse_vcard(vcf_content)
+                    self.extensions[name] = ".vcf"
+                else:
+                    self.extensions[name] = sniff_file_type(member.read(self.HEAD_SIZE))
+            # Attachments without a proper extension are written as "DOC-...-WA0001. " in the chat.
+            self._stems.setdefault(name.rstrip(". "), name)
+
+    def resolve(self, filename: str):
+        """
+        Finds the member a file name from the chat refers to, see resolve_member.
+        Args:
+            filename (str): The file name used in the chat.
+        Returns:
+            str or None: The member name, or None if the archive has no such file.
+        """
+        if filename in self.extensions:
+            return filename
+        return self._stems.get(filename.rstrip(". ")) or self._stems.get(os.path.splitext(filename)[0].rstrip(". "))
+
+    def extension(self, filename: str):
+        """
+        Returns the sniffed extension of an attachment.
+        Args:
+            filename (str): The file name used in the chat.
+        Returns:
+            str or None: The extension, or None if the file is missing or its type unknown.
+        """
+        return self.extensions.get(self.resolve(filename))
+
+    def contact(self, filename: str) -> str:
+        """
+        Returns the contact details of a VCF attachment.
+        Args:
+            filename (str): The VCF file name used in the chat.
+        Returns:
+            str: The contact details in the format "Name|PhoneNumber", or "|" if unavailable.
+        """
+        return self.contacts.get(self.resolve(filename), "|")
+
+
+def build_catalog(file) -> AttachmentCatalog:
+    """
+    Builds the attachment catalog of a chat archive.
+    Args:
+        file (str or file-like object): The ZIP file.
+    Returns:
+        AttachmentCatalog: The catalog.
+    """
+    with ZipFile(file, 'r') as zObject:
+        return AttachmentCatalog(zObject)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date: str) -> datetime:
+    """
+    Converts a MM/DD/YY date string to a datetime.
+    Most messages in a chat share a handful of dates, so results are memoized and each distinct date is only
+    parsed once.
+    Args:
+        date (str): The date string to convert.
+    Returns:
+        datetime: The parsed date.
+    Raises:
+        ValueError: If the string isn't a valid MM/DD/YY date.
+    """
+    return datetime.strptime(date, "%m/%d/%y")
+
+
+@lru_cache(maxsize=1 << 17)
+def parse_time(time: str) -> int:
+    """
+    Parses the time of a message, 12 or 24 hour.
+    Memoized like parse_date; times with seconds (iOS) can take 86,400 distinct values, hence the bigger cache.
+    Args:
+        time (str): The time, e.g. "9:15 PM" or "21:15".
+    Returns:
+        int: Seconds since midnight, 0 if the time can't be read.
+    """
+    match = TIME_PATTERN.match(time.strip())
+    if match is None:
+        return 0
+    hours, minutes, seconds, meridiem = match.groups()
+    hours = int(hours)
+    if meridiem is not None:
+        hours = hours % 12 + (12 if meridiem in "Pp" else 0)
+    return hours * 3600 + int(minutes) * 60 + int(seconds or 0)
+
+
+def get_chat_format(name: str) -> ChatFormat:
+    """
+    Looks a chat format up by name.
+    Args:
+        name (str): The format's name, e.g. "android-us".
+    Returns:
+        ChatFormat: The format.
+    Raises:
+        KeyError: If there's no format by that name.
+    """
+    for chat_format in CHAT_FORMATS:
+        if chat_format.name == name:
+            return chat_format
+    raise KeyError(name)
+
+
+def detect_chat_format(lines: list) -> ChatFormat:
+    """
+    Works out which format a chat export is in from its first lines.
+    Every format is tried on the sample. The one that finds the most message headers wins; ties (only day-first and
+    month-first readings of the same dates can tie) go to the reading that keeps the dates in order over the
+    shortest span of time, then to the earlier format in CHAT_FORMATS.
+    Args:
+        lines (list of str): The first lines (or merged messages) of the chat.
+    Returns:
+        ChatFormat: The best fitting format, the first one if there are no lines at all.
+    Raises:
+        TamperedFileError: If none of the formats fits the first line.
+    """
+    if not lines:
+        return CHAT_FORMATS[0]
+    best, best_score = None, None
+    for rank, chat_format in enumerate(CHAT_FORMATS):
+        if not chat_format.is_message_start(lines[0]):
+            continue
+        dates = []
+        for line in lines:
+            match = chat_format.start.match(line)
+            if match is not None:
+                try:
+                    dates.append(chat_format.parse_date(match.group("date")))
+                except ValueError:
+                    pass
+        disorder = sum(earlier > later for earlier, later in zip(dates, dates[1:]))
+        score = (len(dates), -disorder, -(dates[-1] - dates[0]).days, -rank)
+        if best_score is None or score > best_score:
+            best, best_score = chat_format, score
+    if best is None:
+        # File isn't a proper whatsapp chat file (The first message should be a new one)
+        raise TamperedFileError
+    return best
+
+
+def sniff_chat_format(lines) -> tuple:
+    """
+    Detects the format of a chat from its first lines without losing them.
+    Args:
+        lines (iterable of str): Lines (or merged messages) of the chat.
+    Returns:
+        tuple: The ChatFormat, and an iterator over all the lines, the sampled ones included.
+    Raises:
+        TamperedFileError: If none of the formats fits the first line.
+    """
+    iterator = iter(lines)
+    sample = list(islice(iterator, FORMAT_SAMPLE_LINES))
+    return detect_chat_format(sample), chain(sample, iterator)
+
+
+def verify_date(date):
+    """
+    Validates if a given string is a date that follows the format MM/DD/YY.
+    Other formats are checked with ChatFormat.is_message_start.
+    Args:
+        date (str): The date string to verify.
+    Returns:
+        bool: True if the date is valid, otherwise False.
+    """
+    # Cheap shape check first, continuation lines almost never look like a date.
+    if not DATE_PATTERN.fullmatch(date):
+        return False
+    try:
+        parse_date(date)
+    except ValueError:
+        return False
+    else:
+        return True
+
+def is_chat_file(file_name: str) -> bool:
+    """
+    Tells whether a file name matches WhatsApp's chat file naming conventions.
+    Args:
+        file_name (str): The file name.
+    Returns:
+        bool: True for a chat text file.
+    """
+    # Android names it "WhatsApp Chat with <name>.txt", iOS "_chat.txt".
+    return (file_name[:8] == "WhatsApp" and file_name.endswith(".txt")) or file_name == "_chat.txt"
+
+
+def is_archived_chat_file(member_name: str) -> bool:
+    """
+    Tells whether a ZIP member is the chat text, which exports keep at the top level of the archive.
+    """
+    return "/" not in member_name and is_chat_file(member_name)
+
+
+def find_chat_file(file_names: list) -> str:
+    """
+    Peruses through a list of filenames and selects the one matching whatsapp chat naming conventions.
+    Args:
+        file_names (list): File names to choose from.
+    Returns:
+        file (str): The name of the chat text file.
+    Raises:
+        FileNotFoundError: If none of the names looks like a WhatsApp chat file.
+    """
+    for a_file in file_names:
+        if is_chat_file(a_file):
+            return a_file
+    raise FileNotFoundError
+
+
+def iter_chat_file(file_names: list, chat_dir: str = CHAT_DETAILS_DIR):
+    """
+    Lazily reads the chat file found in the chat-details directory, one line at a time.
+    Args:
+        file_names (list): All the text files in the chat-details directory.
+        chat_dir (str, optional): The chat details directory. Defaults to 'instance/chat-details'.
+    Yields:
+        line (str): A line of the chat file.
+    """
+    file = find_chat_file(file_names)
+    with open(f"{chat_dir}/{file}", mode="r", encoding="utf-8-sig") as txtfile:
+        yield from txtfile
+
+
+def iter_zipped_chat_file(file):
+    """
+    Lazily reads the chat text straight out of the uploaded ZIP, without extracting it first.
+    Args:
+        file (str or file-like object): The ZIP file containing the chat.
+    Yields:
+        line (str): A line of the chat file.
+    Raises:
+        FileNotFoundError: If the archive has no WhatsApp chat text file at its top level.
+    """
+    with ZipFile(file, 'r') as zObject:
+        member = find_chat_file([name for name in zObject.namelist() if "/" not in name])
+        with zObject.open(member) as raw:
+            # utf-8-sig drops the byte order mark some exports start with.
+            yield from io.TextIOWrapper(raw, encoding="utf-8-sig")
+
+
+def find_and_read_chat_file(file_names: list, chat_dir: str = CHAT_DETAILS_DIR) -> list:
+    """
+    Peruses through a list of filenames, selects and read the one matching whatsapp
+    chat naming conventions.
+    Args:
+        file_names (list): All the text files in the chat-details directory.
+        chat_dir (str, optional): The chat details directory. Defaults to 'instance/chat-details'.
+    Returns:
+        file_content (list): The chat content of the text file with each message as a str.
+    """
+    return list(iter_chat_file(file_names, chat_dir))
+
+
+def iter_organized_msgs(lines, chat_format: ChatFormat = None):
+    """
+    Merges messages that were unintentionally split across multiple lines due to newlines, as the lines come in.
+    Continuation lines are collected in a buffer and joined onto the message they belong to when the next
+    message starts, so only one message is held in memory at a time.
+    Args:
+        lines (iterable of str): Lines from the WhatsApp chat file.
+        chat_format (ChatFormat, optional): The format of the chat. Detected from the first lines if not given.
+    Yields:
+        message (str): A complete message, multiline messages merged into a single entry.
+    Raises:
+        TamperedFileError: If the first line isn't the start of a message.
+    """
+    if chat_format is None:
+        chat_format, lines = sniff_chat_format(lines)
+    is_message_start = chat_format.is_message_start
+    buffer = []
+    for line in lines:
+        # If the current line is the continuation of an old message, hold on to it till the message is complete.
+        if not is_message_start(line):
+            if not buffer:
+                # File isn't a proper whatsapp chat file (The first message should be a new one)
+                raise TamperedFileError
+            buffer.append(line)
+            continue
+        if buffer:
+            yield " ".join(buffer)
+        buffer = [line]
+    if buffer:
+        yield " ".join(buffer)
+
+
+def organize_msgs(msg_list: list, chat_format: ChatFormat = None) -> list:
+    """
+    Processes and merges messages that were unintentionally split
+    across multiple lines due to newlines.
+    Args:
+        msg_list (list of str): A list of lines from the WhatsApp chat file.
+        chat_format (ChatFormat, optional): The format of the chat. Detected from the first lines if not given.
+    Returns:
+        msg_list (list of str): A cleaned-up list where multiline messages are correctly
+                     merged into single entries.
+    """
+    return list(iter_organized_msgs(msg_list, chat_format))
+
+
+def iter_parse_chat(messages, catalog: AttachmentCatalog = None, chat_format: ChatFormat = None):
+    """
+    Parses WhatsApp chat messages one at a time and extracts relevant details such as date, time, sender, message body,
+    and message type.
+    Args:
+        messages (iterable of str): WhatsApp chat messages, where each message follows the standard
+                                    format of a WhatsApp export.
+        catalog (AttachmentCatalog, optional): The chat's attachments. Without it contacts come out empty and
+                                               PDFs are only recognized by their name.
+        chat_format (ChatFormat, optional): The format of the chat. Detected from the first messages if not given.
+
+    Yields:
+        a_chat (Message): A structured chat message with the following attributes:
+            - "date" (datetime): The date of the message.
+            - "time" (str): The time the message was sent.
+            - "name" (str or None): The sender's name (None for "info" messages).
+            - "body" (str): The actual message content.
+            - "type" (str): The type of message, which can be one of:
+                - "text" (regular message)
+                - "sticker" (WhatsApp sticker)
+                - "image" (image file)
+                - "audio" (voice note)
+                - "video" (video file)
+                - "contact" (shared contact)
+                - "info" (system-generated messages)
+            - "edited" (bool): Whether the message was edited (True if it contains "<This message was edited>").
+            - "new_day" (bool): Whether the message is the first of its day.
+            See Message for the display fields worked out from these.
+    """
+    catalog = catalog or AttachmentCatalog()
+    if chat_format is None:
+        chat_format, messages = sniff_chat_format(messages)
+    header_pattern, parse_format_date, ios = chat_format.header, chat_format.parse_date, chat_format.layout == "ios"
+    prev_date = None
+    for i in messages:
+        # Pull the date, time, sender and message body out of the message in one go
+        header = header_pattern.match(i)
+        if header is None:
+            raise TamperedFileError
+        date, time, name, msg_body = header.group("date", "time", "name", "body")
+        date = parse_format_date(date)
+        new_day = date != prev_date
+        prev_date = date
+        if name is None:
+            # Message is a whatsapp system notification/message (Not sent by a person)
+            yield Message(date, time, None, msg_body, "info", new_day=new_day)
+            continue
+        kind = msg_body[:3]
+        if ios and "<attached: " in msg_body:
+            # Rewrite iOS's "<attached: name>" the way Android marks attachments, and tell the kind from the name.
+            attachment = IOS_ATTACHMENT_PATTERN.search(msg_body)
+            if attachment is not None:
+                msg_body = f"{msg_body[:attachment.start()]}{attachment.group('file')} (file attached)" \
+                           f"{msg_body[attachment.end():]}"
+                kind = IOS_MEDIA_KINDS.get(attachment.group("kind"), kind)
+        # Determine message types and edit message body where necessary.
+        if "(file attached)" not in msg_body:
+            msg_type = "text"
+        elif kind == "STK":
+            msg_type = "sticker"
+        elif kind == "IMG":
+            msg_type = "image"
+            msg_body = msg_body.replace("(file attached)\n", "|")
+        elif kind == "PTT" or kind == "AUD":
+            msg_type = "audio"
+        elif kind == "VID":
+            msg_type = "video"
+        elif ".vcf" in msg_body:
+            msg_type = "contact"
+            msg_body = catalog.contact(msg_body.split(".vcf")[0] + ".vcf")
+        # Other attachments are typed by their content too, so files without an extension, or with the wrong one,
+        # are still shown as what they are.
+        elif (".pdf" in msg_body or ".PDF" in msg_body
+              or (sniffed := catalog.extension(msg_body.split(" (file attached)")[0])) == ".pdf"):
+            msg_type = "pdf"
+            msg_body = msg_body.replace("(file attached)\n", "|")
+            if msg_body[:3] == "DOC":
+                msg_body = msg_body.replace(" |", "pdf")
+        elif sniffed in SNIFFED_MESSAGE_TYPES:
+            msg_type = SNIFFED_MESSAGE_TYPES[sniffed]
+        elif re.search(r"\b[\w\s()-]+\.[a-zA-Z0-9]{2,5}\b", msg_body) or "DOC" in msg_body:
+            msg_type = "document"
+        else:
+            msg_type = "text"
+
+        # More message body editing
+        if msg_type != "text":
+            msg_body = msg_body.replace("(file attached)\n", "|").strip(" ")
+        if "<This message was edited>" in msg_body:
+            edited = True
+            msg_body = msg_body.removesuffix("<This message was edited>\n")
+        else:
+            edited = False
+        if "Media omitted" in msg_body:
+            msg_body = msg_body.replace("<", "")
+        yield Message(date, time, name, msg_body, msg_type, edited, new_day)
+
+
+def parse_chat(messages: list, catalog: AttachmentCatalog = None, chat_format: ChatFormat = None) -> CompactChat:
+    """
+    Parses a list of WhatsApp chat messages, see iter_parse_chat for the structure of each message.
+    Args:
+        messages (list of str): A list of WhatsApp chat messages.
+        catalog (AttachmentCatalog, optional): The chat's attachments.
+        chat_format (ChatFormat, optional): The format of the chat. Detected from the first messages if not given.
+    Returns:
+        parsed_chat (CompactChat): The structured chat messages, packed.
+    """
+    return CompactChat(iter_parse_chat(messages, catalog, chat_format))
+
+
+def get_chat_page(chat, offset: int, limit: int) -> list:
+    """
+    Picks a window of messages out of a parsed chat.
+    Args:
+        chat (CompactChat or list of Message): The parsed chat.
+        offset (int): Index of the first message in the window.
+        limit (int): Maximum number of messages in the window.
+    Returns:
+        list of Message: The messages in the window.
+    """
+    offset = min(max(offset, 0), len(chat))
+    return chat[offset:offset + max(limit, 0)]
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for parallel parsing, starting it on first use.
+    The pool is usually first needed by an upload job, on a thread of a multithreaded server, and forking a process
+    while another thread holds a lock can deadlock the child. So workers are started from a clean forkserver
+    process (or spawned, where there's no forkserver), which means everything sent to them is pickled and the
+    functions they run must be importable from this module, which doesn't import the Flask app.
+    Args:
+        workers (int): Number of worker processes, only used when the pool is started.
+    Returns:
+        ProcessPoolExecutor: The shared pool.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _parse_pool
+
+
+def iter_chunks(items, size: int):
+    """
+    Groups items into lists of at most 'size' items.
+    Args:
+        items (iterable): The items to group.
+        size (int): Maximum number of items per chunk.
+    Yields:
+        list: The next chunk.
+    """
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def parse_chat_parallel(messages, catalog: AttachmentCatalog = None, workers: int = None, threshold: int = 50_000,
+                        chunk_size: int = 20_000, chat_format: ChatFormat = None) -> CompactChat:
+    """
+    Parses merged WhatsApp chat messages across several processes.
+    Messages are cut into chunks on message boundaries, each chunk is parsed by a worker process and the results are
+    put back together in order. Chats with fewer than 'threshold' messages are parsed in this process, where
+    starting the workers would cost more than it saves.
+    Args:
+        messages (iterable of str): Merged chat messages, as yielded by iter_organized_msgs.
+        catalog (AttachmentCatalog, optional): The chat's attachments.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        threshold (int, optional): Smallest chat worth parsing in parallel. Defaults to 50,000 messages.
+        chunk_size (int, optional): Messages per chunk handed to a worker. Defaults to 20,000.
+        chat_format (ChatFormat, optional): The format of the chat. Detected from the first messages if not given.
+    Returns:
+        parsed_chat (CompactChat): The parsed chat, exactly as parse_chat would return it.
+    """
+    workers = workers or os.cpu_count() or 1
+    iterator = iter(messages)
+    head = list(islice(iterator, threshold))
+    if workers < 2 or len(head) < threshold:
+        return parse_chat(chain(head, iterator), catalog, chat_format)
+
+    # Detect the format once here, rather than in every chunk.
+    chat_format = chat_format or detect_chat_format(head[:FORMAT_SAMPLE_LINES])
+    pool = get_parse_pool(workers)
+    parsed_chat = CompactChat()
+    pending = deque()
+    # Keep only a couple of chunks per worker in flight, so the raw text isn't all held in memory at once.
+    # Each chunk comes back packed and is merged column by column; new_day is worked out from the timestamps,
+    # so it comes out right across chunk boundaries too.
+    for chunk in iter_chunks(chain(head, iterator), chunk_size):
+        pending.append(pool.submit(parse_chat, chunk, catalog, chat_format))
+        if len(pending) >= workers * 2:
+            parsed_chat.extend(pending.popleft().result())
+    while pending:
+        parsed_chat.extend(pending.popleft().result())
+    return parsed_chat
+
+
+def chat_file_size(file) -> int:
+    """
+    Returns the uncompressed size of the chat text in an uploaded ZIP, to tell how far through it a parse is.
+    Args:
+        file (str or file-like object): The ZIP file containing the chat.
+    Raises:
+        FileNotFoundError: If the archive has no WhatsApp chat text file at its top level.
+    """
+    with ZipFile(file, 'r') as zObject:
+        return zObject.getinfo(find_chat_file([name for name in zObject.namelist() if "/" not in name])).file_size
+
+
+def iter_progress(lines, total: int, report, every: int = 4096, finished=None):
+    """
+    Passes lines through, reporting how much of the text has gone by.
+    Args:
+        lines (iterable of str): The lines.
+        total (int): Expected length of all the lines together.
+        report (callable): Called with the fraction of 'total' read so far.
+        every (int, optional): Lines between reports. Defaults to 4096.
+        finished (callable, optional): Called with the number of lines once they have all gone by.
+    Yields:
+        line (str): The next line.
+    """
+    done = count = 0
+    for count, line in enumerate(lines, 1):
+        done += len(line)
+        if not count % every:
+            report(done / total if total else 1.0)
+        yield line
+    if finished is not None:
+        finished(count)
+
+
+def hash_messages(messages) -> str:
+    """
+    Hashes merged chat messages, to recognize them in another export.
+    Args:
+        messages (iterable of str): The messages.
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
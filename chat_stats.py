@@ -0,0 +1,143 @@
+from array import array
+from collections import Counter
+from itertools import compress, repeat
+from operator import add, floordiv, mod
+
+try:
+    import numpy
+except ImportError:  # Optional, the same aggregates are computed with the standard library without it.
+    numpy = None
+
+# 1970-01-01, day 0 of the timestamps, was a Thursday.
+EPOCH_WEEKDAY = 3
+
+
+class ChatColumns:
+    """
+    Columnar copy of a parsed chat: one packed array per field rather than one object per message, with senders and
+    types stored as small integer codes into lookup tables.
+
+    Attributes:
+        senders (list): Sender names by code. Code 0 is None, the "sender" of info messages.
+        types (list of str): Message types by code.
+        timestamps (array): Seconds since 1970-01-01 (chat local time) of every message, in chat order.
+        sender_codes (array): Sender code of every message.
+        type_codes (array): Type code of every message.
+        edited (array): 1 for every edited message, 0 otherwise.
+    """
+
+    def __init__(self, chat):
+        """
+        Builds the columns in a single pass over the chat.
+        Args:
+            chat (list of Message): The parsed chat.
+        """
+        self.senders = [None]
+        self.types = []
+        self.timestamps = array("q")
+        self.sender_codes = array("I")
+        self.type_codes = array("B")
+        self.edited = array("B")
+        sender_codes, type_codes = {None: 0}, {}
+        for message in chat:
+            sender = sender_codes.get(message.name)
+            if sender is None:
+                sender = sender_codes[message.name] = len(self.senders)
+                self.senders.append(message.name)
+            msg_type = type_codes.get(message.type)
+            if msg_type is None:
+                msg_type = type_codes[message.type] = len(self.types)
+                self.types.append(message.type)
+            self.timestamps.append(message.timestamp)
+            self.sender_codes.append(sender)
+            self.type_codes.append(msg_type)
+            self.edited.append(message.edited)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+def _counts(counter: Counter, size: int) -> list:
+    """
+    Turns a Counter of codes 0..size-1 into a list of counts.
+    """
+    return [counter.get(code, 0) for code in range(size)]
+
+
+def _count_codes(columns: ChatColumns) -> dict:
+    """
+    Counts messages by sender, type, sender and type, hour and weekday, plus edits by sender, with NumPy.
+    """
+    senders = numpy.frombuffer(columns.sender_codes, dtype=columns.sender_codes.typecode).astype(numpy.int64)
+    types = numpy.frombuffer(columns.type_codes, dtype=columns.type_codes.typecode)
+    timestamps = numpy.frombuffer(columns.timestamps, dtype=columns.timestamps.typecode)
+    edited = numpy.frombuffer(columns.edited, dtype=columns.edited.typecode)
+    n_senders, n_types = len(columns.senders), len(columns.types)
+    by_sender_type = numpy.bincount(senders * n_types + types, minlength=n_senders * n_types)
+    return {
+        "sender_type": by_sender_type.reshape(n_senders, n_types).tolist(),
+        "sender_edited": numpy.bincount(senders, weights=edited, minlength=n_senders).astype(numpy.int64).tolist(),
+        "hours": numpy.bincount(timestamps // 3600 % 24, minlength=24).tolist(),
+        "weekdays": numpy.bincount((timestamps // 86400 + EPOCH_WEEKDAY) % 7, minlength=7).tolist(),
+    }
+
+
+def _count_codes_python(columns: ChatColumns) -> dict:
+    """
+    Same as _count_codes, with the standard library only. Counter and map do the looping in C.
+    """
+    timestamps = columns.timestamps
+    n_senders, n_types = len(columns.senders), len(columns.types)
+    by_sender_type = Counter(map(add, map(n_types.__mul__, columns.sender_codes), columns.type_codes))
+    hours = Counter(map(mod, map(floordiv, timestamps, repeat(3600)), repeat(24)))
+    days = map(add, map(floordiv, timestamps, repeat(86400)), repeat(EPOCH_WEEKDAY))
+    return {
+        "sender_type": [[by_sender_type.get(sender * n_types + msg_type, 0) for msg_type in range(n_types)]
+                        for sender in range(n_senders)],
+        "sender_edited": _counts(Counter(compress(columns.sender_codes, columns.edited)), n_senders),
+        "hours": _counts(hours, 24),
+        "weekdays": _counts(Counter(map(mod, days, repeat(7))), 7),
+    }
+
+
+def chat_stats(columns: ChatColumns) -> dict:
+    """
+    Works out a chat's activity statistics.
+    Args:
+        columns (ChatColumns): The chat, or anything with the same columns (like chat_parser.CompactChat).
+    Returns:
+        dict: JSON ready statistics:
+            - "messages" (int): Number of messages, info messages included.
+            - "first", "last" (int or None): Timestamps of the first and last message.
+            - "types" (dict): Number of messages of each type.
+            - "hours" (list of int): Number of messages sent in each hour of the day, from midnight.
+            - "weekdays" (list of int): Number of messages sent on each day of the week, from Monday.
+            - "edited" (int), "edit_rate" (float): Edited messages, and their share of the messages people sent.
+            - "senders" (list of dict): Per sender "name", "messages", "types", "edited" and "edit_rate", most active
+                                        sender first. Info messages aren't anyone's.
+    """
+    counts = _count_codes(columns) if numpy is not None else _count_codes_python(columns)
+    types = [sum(column) for column in zip(*counts["sender_type"])]
+    senders = []
+    for code, name in enumerate(columns.senders):
+        messages = sum(counts["sender_type"][code])
+        if name is None or not messages:
+            continue
+        edited = counts["sender_edited"][code]
+        senders.append({"name": name, "messages": messages, "edited": edited, "edit_rate": edited / messages,
+                        "types": {msg_type: count for msg_type, count in zip(columns.types, counts["sender_type"][code])
+                                  if count}})
+    senders.sort(key=lambda sender: sender["messages"], reverse=True)
+    sent = sum(sender["messages"] for sender in senders)
+    edited = sum(sender["edited"] for sender in senders)
+    return {
+        "messages": len(columns),
+        "first": columns.timestamps[0] if len(columns) else None,
+        "last": columns.timestamps[-1] if len(columns) else None,
+        "types": {msg_type: count for msg_type, count in zip(columns.types, types)},
+        "hours": counts["hours"],
+        "weekdays": counts["weekdays"],
+        "edited": edited,
+        "edit_rate": edited / sent if sent else 0.0,
+        "senders": senders,
+    }
@@ -0,0 +1,186 @@
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def directory_size(path: str) -> int:
+    """
+    Adds up the size of every file under a directory.
+    Args:
+        path (str): The directory.
+    Returns:
+        int: The total size in bytes, files that vanish while it's counted are left out.
+    """
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class ChatStore:
+    """
+    Keeps every uploaded chat apart, keyed by a chat ID handed to the uploader's session.
+
+    Each chat gets its own extraction directory under 'root'. Parsed chats are kept in memory in LRU order,
+    and a chat that isn't in memory (evicted, or uploaded through another worker) is rebuilt from its
+    directory with 'loader'. Chats untouched for longer than 'ttl' seconds are dropped from memory and disk.
+
+    Both caps are in bytes rather than chats, so one huge chat counts for as much as many small ones. Memory is
+    measured with 'sizeof', disk by adding up the files in every chat directory, which is why the disk is only
+    checked when a chat is put, not on every read.
+
+    Attributes:
+        root (str): Directory holding one sub-directory per chat.
+        loader (callable): Rebuilds a chat from its directory, takes the directory path.
+        max_bytes (int): Memory the parsed chats kept in this process may take. The most recently used chat is
+                         kept even if it alone is bigger.
+        max_disk_bytes (int): Disk space the chat directories may take, shared by every worker.
+        ttl (float): Seconds a chat may go unused before it is evicted.
+        sizeof (callable): Returns the bytes of memory a stored chat takes.
+    """
+    ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+    def __init__(self, root: str, loader, max_bytes: int = 512 * 1024 * 1024,
+                 max_disk_bytes: int = 4 * 1024 * 1024 * 1024, ttl: float = 3600, sizeof=None):
+        """
+        Initializes an empty store. Without 'sizeof', chats are measured with sys.getsizeof, which doesn't count
+        what they refer to.
+        """
+        self.root = root
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or sys.getsizeof
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new_chat_id(self) -> str:
+        """
+        Creates a fresh chat ID.
+        Returns:
+            str: A random 32 character hex ID.
+        """
+        return uuid.uuid4().hex
+
+    def chat_dir(self, chat_id: str) -> str:
+        """
+        Returns the extraction directory of a chat.
+        Args:
+            chat_id (str): The chat ID.
+        Raises:
+            KeyError: If the ID isn't one this store could have issued.
+        """
+        if not isinstance(chat_id, str) or not self.ID_PATTERN.fullmatch(chat_id):
+            raise KeyError(chat_id)
+        return os.path.join(self.root, chat_id)
+
+    def put(self, chat_id: str, chat):
+        """
+        Stores a parsed chat and evicts whatever no longer fits.
+        Args:
+            chat_id (str): The chat ID.
+            chat: The parsed chat, stored as is.
+        """
+        with self._lock:
+            self._chats[chat_id] = (chat, time.time())
+            self._chats.move_to_end(chat_id)
+        self.touch(chat_id)
+        self.evict()
+
+    def get(self, chat_id: str):
+        """
+        Fetches a chat, rebuilding it from disk when it isn't in this process's memory.
+        Args:
+            chat_id (str): The chat ID.
+        Returns:
+            The parsed chat, or None if the ID is unknown or has expired.
+        """
+        try:
+            directory = self.chat_dir(chat_id)
+        except KeyError:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._chats[chat_id] = (entry[0], now)
+                self._chats.move_to_end(chat_id)
+                chat = entry[0]
+            else:
+                self._chats.pop(chat_id, None)
+                chat = None
+        if chat is None:
+            try:
+                if now - os.path.getmtime(directory) > self.ttl:
+                    return None
+            except OSError:
+                return None
+            chat = self.loader(directory)
+            if chat is None:
+                return None
+            with self._lock:
+                self._chats[chat_id] = (chat, now)
+                self._chats.move_to_end(chat_id)
+            self.evict_memory()
+        self.touch(chat_id)
+        return chat
+
+    def touch(self, chat_id: str):
+        """
+        Marks a chat's directory as recently used, so other workers don't evict it.
+        Args:
+            chat_id (str): The chat ID.
+        """
+        try:
+            os.utime(self.chat_dir(chat_id))
+        except OSError:
+            pass
+
+    def evict_memory(self):
+        """
+        Drops expired chats from memory, then least recently used ones until the rest fit in 'max_bytes'.
+        """
+        now = time.time()
+        with self._lock:
+            for chat_id in [key for key, (_, used) in self._chats.items() if now - used > self.ttl]:
+                del self._chats[chat_id]
+            total = sum(self.sizeof(chat) for chat, _ in self._chats.values())
+            while total > self.max_bytes and len(self._chats) > 1:
+                _, (chat, _) = self._chats.popitem(last=False)
+                total -= self.sizeof(chat)
+
+    def evict(self):
+        """
+        Drops expired and least recently used chats from memory, then from disk.
+        """
+        self.evict_memory()
+        now = time.time()
+        with self._lock:
+            in_memory = set(self._chats)
+
+        try:
+            entries = [entry for entry in os.scandir(self.root) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        # Most recently used first: each directory is kept if it still fits, chats in memory always are.
+        total = 0
+        for entry in entries:
+            if now - entry.stat().st_mtime <= self.ttl:
+                size = directory_size(entry.path)
+                if total + size <= self.max_disk_bytes or entry.name in in_memory:
+                    total += size
+                    continue
+            with self._lock:
+                self._chats.pop(entry.name, None)
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+
+
+class ConfigCache:
+    """
+    Keeps a JSON config file loaded in memory, reading it again only once its modification time (or size) changes,
+    and checking that at most every 'check_interval' seconds, so requests using it don't touch the disk.
+
+    A file that is missing, or that fails to parse or validate, leaves the last good value in place (or 'default'
+    if there never was one), so a half-saved edit never breaks the pages using it.
+
+    Attributes:
+        path (str): The JSON file.
+        default: Value used while the file has never loaded, as is.
+        validate (callable or None): Turns the parsed JSON into the cached value, raising ValueError (or KeyError,
+                                     TypeError) if it's invalid.
+        check_interval (float): Seconds between two checks of the file's modification time.
+        hits (int): Lookups answered without reading the file.
+        reloads (int): Times the file was read.
+        errors (int): Reads that failed, the previous value was kept.
+    """
+
+    def __init__(self, path: str, default=None, validate=None, check_interval: float = 1.0):
+        """
+        Initializes the cache and loads the file.
+        """
+        self.path = path
+        self.default = default
+        self.validate = validate
+        self.check_interval = check_interval
+        self.hits = 0
+        self.reloads = 0
+        self.errors = 0
+        self._value = default
+        self._signature = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+        self.get()
+
+    def get(self):
+        """
+        Returns the file's current value, reloading it first if it changed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                self.hits += 1
+                return self._value
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                signature = None
+            else:
+                signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                self.hits += 1
+                return self._value
+            self._signature = signature
+            if signature is not None:
+                self._load()
+            return self._value
+
+    def _load(self):
+        """
+        Reads, parses and validates the file, keeping the previous value if any of it fails.
+        """
+        self.reloads += 1
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                value = json.load(file)
+            if self.validate is not None:
+                value = self.validate(value)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            self.errors += 1
+            print(f"Couldn't load {self.path}, keeping the previous version: {error!r}")
+            return
+        self._value = value
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        Returns:
+            dict: Hits, reloads and errors.
+        """
+        with self._lock:
+            return {"hits": self.hits, "reloads": self.reloads, "errors": self.errors}
@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from functools import lru_cache
+
+from flask import request, send_file
+
+try:
+    import brotli
+except ImportError:  # Optional, assets are still precompressed with gzip without it.
+    brotli = None
+
+# Text assets worth serving compressed, images and media are compressed already.
+COMPRESSIBLE_EXTENSIONS = frozenset({".css", ".js", ".map", ".svg", ".json", ".txt", ".html"})
+# Content-Encoding, file extension and compressor of every precompressed variant, most preferred first.
+ENCODINGS = [("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+if brotli is not None:
+    ENCODINGS.insert(0, ("br", ".br", lambda data: brotli.compress(data, quality=11)))
+# Cache-Control max-age of responses that may be cached forever: a year, the most browsers honour.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    """
+    Hashes a file, cached for as long as its size and modification time stay the same.
+    """
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's content, hashing it only the first time it's asked for.
+    Raises:
+        OSError: If the file can't be read.
+    """
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_size, stat.st_mtime_ns)
+
+
+def fingerprint(path: str):
+    """
+    Returns a short content hash of a file, to version its URL with.
+    Returns:
+        str or None: The fingerprint, or None if the file doesn't exist.
+    """
+    try:
+        return file_digest(path)[:16]
+    except OSError:
+        return None
+
+
+class PrecompressedVariants:
+    """
+    Keeps gzip (and, with the brotli package, brotli) compressed copies of text assets, so they're compressed once
+    rather than on every request. Copies are named after the hash of the asset, so an edited asset never gets
+    served a stale copy.
+
+    Attributes:
+        root (str): Directory holding the compressed copies.
+    """
+
+    def __init__(self, root: str):
+        """
+        Initializes the variants, the directory is created on the first one.
+        """
+        self.root = root
+        self._lock = threading.Lock()
+
+    def get(self, path: str, digest: str, accept_encodings):
+        """
+        Picks the best compressed copy of an asset the client accepts, compressing it first if needed.
+        Args:
+            path (str): The asset.
+            digest (str): Its content hash.
+            accept_encodings: The request's Accept-Encoding header, as parsed by Werkzeug.
+        Returns:
+            tuple: The path to send and its Content-Encoding, which is None for the asset itself.
+        """
+        if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return path, None
+        for encoding, extension, compress in ENCODINGS:
+            if not accept_encodings[encoding]:
+                continue
+            variant = os.path.join(self.root, f"{digest}{extension}")
+            if not os.path.exists(variant):
+                try:
+                    self._write(variant, path, compress)
+                except OSError:
+                    return path, None
+            return variant, encoding
+        return path, None
+
+    def _write(self, variant: str, path: str, compress):
+        """
+        Compresses an asset, writing under a temporary name first so no reader ever sees half a copy.
+        """
+        with open(path, "rb") as file:
+            data = compress(file.read())
+        os.makedirs(self.root, exist_ok=True)
+        partial = f"{variant}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(partial, "wb") as file:
+            file.write(data)
+        os.replace(partial, variant)
+
+
+def stat_etag(path: str) -> str:
+    """
+    Returns a tag of a file made of its size and modification time, which, unlike file_digest, doesn't read it.
+    Raises:
+        OSError: If the file doesn't exist.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def send_cached_file(path: str, max_age: int = 0, immutable: bool = False, private: bool = False,
+                     variants: PrecompressedVariants = None, hash_content: bool = True, mimetype: str = None):
+    """
+    Sends a file with a content hash ETag, so browsers revalidating it get a 304 until its content changes, and
+    answers Range requests with just the bytes asked for, so seeking in audio and video doesn't download it again.
+    Args:
+        path (str): The file, which must exist.
+        max_age (int, optional): Seconds browsers may use the file without revalidating it.
+        immutable (bool, optional): The URL's content never changes, browsers needn't revalidate even on reload.
+        private (bool, optional): Only the browser may cache the file, shared caches mustn't.
+        variants (PrecompressedVariants, optional): Where to get compressed copies of text assets from.
+        hash_content (bool, optional): Tag the file with a hash of its content. When False it gets a weak ETag of
+            its size and modification time instead, so the first request for a large file doesn't wait for all of
+            it to be read. Defaults to True.
+        mimetype (str, optional): The file's Content-Type. Guessed from its name if not given.
+    Returns:
+        Response: The file, a part of it (206) or Not Modified (304).
+    """
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if not hash_content:
+        return _send_stat_tagged_file(path, mimetype, max_age, immutable, private)
+    digest = file_digest(path)
+    sent, encoding = path, None
+    if variants is not None:
+        sent, encoding = variants.get(path, digest, request.accept_encodings)
+    # Each encoding is a different representation of the file, with its own tag.
+    etag = digest if encoding is None else f"{digest}-{encoding}"
+    response = send_file(os.path.abspath(sent), mimetype=mimetype, etag=etag, max_age=max_age, conditional=True)
+    if encoding is not None:
+        response.content_encoding = encoding
+    if variants is not None and os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add("Accept-Encoding")
+    return _set_cache_control(response, immutable, private)
+
+
+def _send_stat_tagged_file(path: str, mimetype: str, max_age: int, immutable: bool, private: bool):
+    """
+    Sends a file like send_cached_file, with a weak ETag from stat_etag rather than a content hash.
+    """
+    # send_file only makes strong tags, so the tag is set here and the conditional request answered after it.
+    response = send_file(os.path.abspath(path), mimetype=mimetype, etag=False, max_age=max_age, conditional=False)
+    response.set_etag(stat_etag(path), weak=True)
+    response = response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
+    return _set_cache_control(response, immutable, private)
+
+
+def _set_cache_control(response, immutable: bool, private: bool):
+    """
+    Marks a response private and/or immutable for send_cached_file.
+    """
+    if private:
+        response.cache_control.public = None
+        response.cache_control.private = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
@@ -1,19 +1,46 @@
-from flask import Flask, abort, render_template, redirect, url_for, flash, request
-from zipfile import ZipFile
+from flask import Flask, Request, Response, abort, g, render_template, redirect, url_for, flash, request, session, jsonify
+from werkzeug.security import safe_join
+from zipfile import BadZipFile, ZipFile
 import os
-import re
-import fnmatch
-from datetime import datetime
+import threading
+from datetime import date
+from functools import partial
+from collections import Counter, deque
+from itertools import chain, islice
 import shutil
-import json
+import hashlib
+import mimetypes
+import sqlite3
+import sys
+import time
+import zlib
+from chat_store import ChatStore
+from parse_cache import ParseCache
+from search_index import SearchIndex
+from chat_stats import ChatColumns, chat_stats
+from upload_jobs import UploadJobs
+from media_previews import PreviewCache
+from http_cache import IMMUTABLE_MAX_AGE, PrecompressedVariants, fingerprint, send_cached_file
+from config_cache import ConfigCache
+from metrics import Registry, profile_path, profiled
+import cProfile
+from upload_stream import ArchiveSpool, NotAChatExport
+from chat_database import ChatDatabase, write_chat_database
+from chat_parser import (CHAT_DETAILS_DIR, CompactChat, TamperedFileError, build_catalog, chat_file_size,
+                         get_chat_page, get_names, hash_messages, is_archived_chat_file, iter_organized_msgs,
+                         iter_progress, iter_zipped_chat_file, parse_chat_parallel, sniff_chat_format, sniff_mimetype)
 
 class ChatManager:
     """
     Manages chat data and user information.
 
     Attributes:
-        chat (list or None): Stores the chat messages.
+        chat (CompactChat or None): Stores the chat messages.
         username (str or None): Stores the username of the chat participant.
+        search_index (SearchIndex or None): Index over the chat messages, built on the first search. Chats kept in
+                                            a ChatDatabase are searched with its own indexes instead.
+        stats (dict or None): Activity statistics of the chat, worked out the first time they're asked for.
+        days (dict or None): Day index of the chat, see get_days.
     """
     def __init__(self):
         """
@@ -21,14 +48,79 @@ class ChatManager:
         """
         self.chat = None
         self.username = None
+        self.search_index = None
+        self.stats = None
+        self.days = None
+        self._lock = threading.Lock()
 
-    def set_chat(self, chat: list):
+    def set_chat(self, chat):
         """
         Sets the chat messages.
         Args:
-            chat (list): A list of chat messages.
+            chat (CompactChat, ChatDatabase or list of Message): The chat messages.
         """
         self.chat = chat
+        self.search_index = None
+        self.stats = None
+        self.days = None
+
+    def nbytes(self) -> int:
+        """
+        Returns roughly how much memory the chat and its search index take, for the chat store's memory cap.
+        A ChatDatabase keeps its messages on disk, so it barely counts.
+        """
+        chat, search_index = self.chat, self.search_index
+        size = chat.nbytes() if isinstance(chat, CompactChat) else sys.getsizeof(chat)
+        if isinstance(search_index, SearchIndex):
+            size += search_index.nbytes()
+        return size
+
+    def get_search_index(self):
+        """
+        Returns the search index of the chat, building it the first time it's needed.
+        Returns:
+            SearchIndex or ChatDatabase: The index, or the chat's database, which searches the same way.
+        """
+        if isinstance(self.chat, ChatDatabase):
+            return self.chat
+        with self._lock:
+            if self.search_index is None:
+                self.search_index = SearchIndex(self.chat)
+            return self.search_index
+
+    def get_stats(self) -> dict:
+        """
+        Returns the activity statistics of the chat, working them out the first time they're needed.
+        Returns:
+            dict: See chat_stats.
+        """
+        with self._lock:
+            if self.stats is None:
+                if isinstance(self.chat, CompactChat):
+                    columns = self.chat
+                elif isinstance(self.chat, ChatDatabase):
+                    columns = self.chat.columns()
+                else:
+                    columns = ChatColumns(self.chat)
+                self.stats = chat_stats(columns)
+            return self.stats
+
+    def get_days(self) -> dict:
+        """
+        Returns the day index of the chat, as JSON ready columns, converting it the first time it's needed.
+        Parsed chats index their days as they're built, so no message is read for it.
+        Returns:
+            dict: "dates" (list of str, YYYY-MM-DD), "offsets" (list of int, index of each day's first message) and
+                  "counts" (list of int, messages that day), one entry per run of messages sent on the same day.
+        """
+        with self._lock:
+            if self.days is None:
+                chat = self.chat if isinstance(self.chat, (CompactChat, ChatDatabase)) else CompactChat(self.chat)
+                days = chat.days()
+                self.days = {"dates": [day.isoformat() for day, _, _ in days],
+                             "offsets": [offset for _, offset, _ in days],
+                             "counts": [count for _, _, count in days]}
+            return self.days
 
     def set_name(self, name: str):
         """
@@ -39,332 +131,593 @@ class ChatManager:
         self.username = name
 
 
-class TamperedFileError(Exception):
+# Number of leading messages that identify a chat across exports, see parse_archive.
+FINGERPRINT_MESSAGES = 50
+# The uploaded ZIP is kept in the chat's directory under this name, attachments are extracted from it on demand.
+# WhatsApp never names attachments with a leading dot, so it can't clash with one, and chat_media refuses dot
+# files (see ensure_media). Chat directories are outside the static folder, so that's the only way in.
+ARCHIVE_NAME = ".archive.zip"
+# With CHAT_STORAGE set to "sqlite", the parsed chat is written next to it under this name, out of reach for the
+# same reasons.
+DATABASE_NAME = ".chat.sqlite3"
+# The kind of preview shown for each type of media message, see chat_preview.
+PREVIEW_KINDS = {"image": "thumbnail", "sticker": "sticker", "video": "poster"}
+# A lock for every attachment ensure_media is extracting, so concurrent requests for it wait rather than race.
+_extracting = {}
+_extracting_lock = threading.Lock()
+
+
+def save_archive(file, chat_dir: str) -> tuple:
     """
-    Custom exception for handling improperly structured files.
-    Raised when a file does not follow the expected format.
+    Saves the uploaded ZIP file into a chat details directory, hashing it on the way.
+    Args:
+        file (file-like object): The uploaded ZIP file. Uploads spooled by an ArchiveSpool are already on disk and
+                                 hashed, so they're just linked into place.
+        chat_dir (str): The chat details directory, created if missing.
+    Returns:
+        tuple: The path of the saved archive and the SHA-256 hex digest of its content.
     """
+    os.makedirs(chat_dir, exist_ok=True)
+    archive = os.path.join(chat_dir, ARCHIVE_NAME)
+    spool = getattr(file, "stream", file)
+    if isinstance(spool, ArchiveSpool):
+        spool.save_as(archive)
+        return archive, spool.hexdigest()
+    digest = hashlib.sha256()
+    file.seek(0)
+    with open(archive, "wb") as saved:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+            saved.write(chunk)
+    return archive, digest.hexdigest()
 
-    def __init__(self, message="What kinda file is this fam?"):
-        """
-        Initializes the exception with a default or custom error message.
-        Args:
-            message (str, optional): The error message to display. Defaults to a casual phrasing.
-        """
-        super().__init__(message)
+
+def resolve_member(member_names: list, filename: str):
+    """
+    Finds the archive member a file name from the chat refers to.
+    Attachments without a proper extension are written as "DOC-...-WA0001. " in the chat but stored as
+    "DOC-...-WA0001." in the archive, and get renamed once their real type is known, so those are matched on
+    their stem.
+    Args:
+        member_names (list): Names of the members in the archive.
+        filename (str): The file name used in the chat.
+    Returns:
+        str or None: The member name, or None if the archive has no such file.
+    """
+    if filename in member_names:
+        return filename
+    stem = os.path.splitext(filename)[0].rstrip(". ")
+    for name in member_names:
+        if "/" not in name and name.rstrip(". ") == stem:
+            return name
+    return None
 
 
-chat_manager = ChatManager()
+def ensure_media(chat_dir: str, filename: str):
+    """
+    Makes sure an attachment is on disk, extracting it from the saved archive the first time it's asked for.
+    Args:
+        chat_dir (str): The chat details directory.
+        filename (str): The attachment's file name as used in the chat.
+    Returns:
+        str or None: The path the attachment is at, or None for names that would point outside the directory.
+                     The path won't exist if the archive doesn't have the file.
+    """
+    path = safe_join(chat_dir, filename)
+    if path is None or filename.startswith("."):
+        return None
+    if os.path.exists(path):
+        return path
+    with _extracting_lock:
+        extracting = _extracting.setdefault(path, threading.Lock())
+    with extracting:
+        if os.path.exists(path):
+            return path
+        # Written under a temporary name first so other worker processes never see half a file.
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with ZipFile(os.path.join(chat_dir, ARCHIVE_NAME), 'r') as zObject:
+                member = resolve_member(zObject.namelist(), filename)
+                if member is None:
+                    return path
+                with zObject.open(member) as source, open(temporary, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(temporary, path)
+                extracted_bytes.inc(zObject.getinfo(member).file_size)
+        except (OSError, KeyError) as error:
+            app.logger.warning("Couldn't extract %s from %s: %r", filename, chat_dir, error)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        finally:
+            with _extracting_lock:
+                _extracting.pop(path, None)
+    return path
 
 
-def delete_directory(dir_path):
+def file_crc32(path: str) -> int:
+    """
+    Returns the CRC-32 of a file's content, the checksum ZIP archives keep for every member.
     """
-    Deletes a directory and all its contents.
+    crc = 0
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def extract_new_members(archive: str, chat_dir: str, base_dir: str = None, progress=None):
+    """
+    Extracts every member of an archive into a chat details directory, reusing files an earlier upload of the same
+    chat already extracted.
     Args:
-        dir_path (str): The path to the directory.
+        archive (str): Path of the ZIP file.
+        chat_dir (str): The chat details directory.
+        base_dir (str, optional): Directory of an earlier export of the same chat. Members found there with the same
+                                  CRC-32 and size are hard linked (or copied) instead of being extracted again.
+                                  WhatsApp reuses names like IMG-20230102-WA0001.jpg, so the name isn't enough.
+        progress (callable, optional): Called with the fraction of members done after each one.
     Returns:
         None
     """
-    try:
-        shutil.rmtree(dir_path)
-        print(f"Deleted directory and its contents: {dir_path}")
-    except FileNotFoundError:
-        print(f"Directory not found: {dir_path}")
-    except Exception as e:
-        print(f"Error: {e}")
+    # The earlier archive has the checksum of every file extracted from it, so they needn't be read to compare.
+    base_members = None
+    if base_dir is not None:
+        try:
+            with ZipFile(os.path.join(base_dir, ARCHIVE_NAME), 'r') as base_archive:
+                base_members = {info.filename: (info.CRC, info.file_size) for info in base_archive.infolist()}
+        except (OSError, BadZipFile):
+            pass
+    with ZipFile(archive, 'r') as zObject:
+        members = zObject.infolist()
+        for done, info in enumerate(members):
+            if progress is not None:
+                progress(done / len(members))
+            if base_dir is not None and not info.is_dir():
+                existing = safe_join(base_dir, info.filename)
+                target = safe_join(chat_dir, info.filename)
+                if existing and target and os.path.isfile(existing) and os.path.getsize(existing) == info.file_size:
+                    if base_members is not None:
+                        same = base_members.get(info.filename) == (info.CRC, info.file_size)
+                    else:
+                        same = file_crc32(existing) == info.CRC
+                    if same:
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        try:
+                            os.link(existing, target)
+                        except OSError:
+                            shutil.copy2(existing, target)
+                        continue
+            zObject.extract(info, chat_dir)
+            extracted_bytes.inc(info.file_size)
 
 
-def extract_zipfile(file):
+def parse_archive(archive: str, digest: str = None, chat_dir: str = None, progress=None) -> tuple:
     """
-    Extracts the contents of a ZIP file into the 'static/chat-details' directory.
+    Parses the chat in a saved archive, reusing the parse of an earlier export of the same chat when there is one.
+    WhatsApp exports repeat the whole history, so a newer export starts with the same messages as the older one.
+    The chat is recognized by a fingerprint of its first FINGERPRINT_MESSAGES messages; if the cache holds an earlier
+    parse and the newer export still has that parse's last message in the same place, only the messages after it
+    are parsed and appended.
     Args:
-        file (str or file-like object): The ZIP file to be extracted.
+        archive (str): Path of the ZIP file.
+        digest (str, optional): Content hash of the archive. If given, this parse is recorded as the chat's latest
+                                so the next export can build on it; it must also be put in the parse cache under it.
+        chat_dir (str, optional): The directory this upload lives in, recorded along with the parse.
+        progress (callable, optional): Called as progress(stage, fraction) as the parse goes on. The stages are
+                                       "extracting" (reading the attachments' headers), "merging" (reading the chat
+                                       text up to the new messages) and "parsing"; fraction is the share of the chat
+                                       text read so far.
     Returns:
-        None
+        tuple: The parsed chat (CompactChat), and the directory of the earlier upload it was built on (or None).
+    Raises:
+        FileNotFoundError: If the archive has no chat file.
+        TamperedFileError: If the chat file isn't a proper WhatsApp export.
     """
-    # Clear files left in the chat details directory.
-    delete_directory("static/chat-details")
-    # Extract zipfile
-    with ZipFile(file, 'r') as zObject:
-        # Extracting all the members of the zip
-        # into a specific location.
-        zObject.extractall(
-            path="static/chat-details")
+    progress = progress or (lambda stage, fraction: None)
+    stage = "extracting"
+    progress(stage, 0.0)
+    with stage_seconds.time(stage="catalog"):
+        catalog = build_catalog(archive)
+    workers, threshold = app.config['PARSE_WORKERS'], app.config['PARALLEL_PARSE_THRESHOLD']
+    total = chat_file_size(archive)
+
+    def read_chat(finished):
+        return iter_progress(iter_zipped_chat_file(archive), total, lambda fraction: progress(stage, fraction),
+                             finished=finished)
+
+    # Reading, merging and parsing the chat text stream into each other, so they're timed as one stage.
+    start = time.perf_counter()
+    stage = "merging"
+    # Lines are only counted once they're parsed, the first read may be given up for a full parse.
+    first_read = []
+    chat_format, lines = sniff_chat_format(read_chat(first_read.append))
+    messages = iter_organized_msgs(lines, chat_format)
+    head = list(islice(messages, FINGERPRINT_MESSAGES))
+    fingerprint = hash_messages(head) if len(head) == FINGERPRINT_MESSAGES else None
+    latest = parse_cache.get_latest(fingerprint) if fingerprint else None
+
+    chat = base_dir = None
+    last_message = head[-1] if head else None
+    # Messages taken over from the earlier parse.
+    reused = 0
+
+    def remember(items):
+        # Keeps track of the last message parsed, to recognize where the next export picks up.
+        nonlocal last_message
+        for item in items:
+            last_message = item
+            yield item
 
+    if latest is not None:
+        record, base_chat = latest
+        messages = chain(head, messages)
+        # Skip what was parsed before, only checking that the last known message is where it should be.
+        known = deque(islice(messages, record["count"]), maxlen=1)
+        if len(known) == 1 and hash_messages(known) == record["tail"]:
+            last_message = known[0]
+            stage = "parsing"
+            reused = len(base_chat)
+            base_chat.extend(parse_chat_parallel(remember(messages), catalog, workers, threshold,
+                                                 chat_format=chat_format))
+            chat = base_chat
+            base_dir = record.get("chat_dir")
+            lines_read.inc(sum(first_read))
+    if chat is None:
+        # Not a continuation of a chat we know, parse it all, starting over since 'messages' may be used up.
+        stage = "parsing"
+        messages = iter_organized_msgs(read_chat(lines_read.inc), chat_format)
+        chat = parse_chat_parallel(remember(messages), catalog, workers, threshold, chat_format=chat_format)
+    stage_seconds.observe(time.perf_counter() - start, stage="parse")
+    count_messages(chat, reused)
 
-def get_files_by_extension(directory, extension):
+    if digest is not None and fingerprint is not None:
+        parse_cache.put_latest(fingerprint, {"key": digest, "count": len(chat), "tail": hash_messages([last_message]),
+                                             "chat_dir": chat_dir})
+    return chat, base_dir
+
+
+def count_messages(chat, start: int = 0):
     """
-    Returns a list of files matching the extension in the directory..
+    Adds the messages of a freshly parsed chat to the messages_parsed counter, by type.
     Args:
-        directory (str): Directory to search for files.
-        extension (str): file extension to search for.
+        chat (CompactChat): The chat.
+        start (int, optional): Index of the first message parsed, earlier ones were reused from another parse.
     """
-    return [f for f in os.listdir(directory) if fnmatch.fnmatch(f, f"*{extension}")]
+    for code, count in Counter(chat.type_codes[start:]).items():
+        messages_parsed.inc(count, type=chat.types[code])
 
 
-def detect_encrypted_pdf(file_path):
+def process_upload(progress, chat_id: str, chat_dir: str, archive: str, digest: str):
     """
-    Detects if a file is a PDF by checking its signature and renames it accordingly.
+    Parses an uploaded chat and adds it to the chat store, run in the background by upload_jobs.
     Args:
-        file_path (str): The path to the file being checked.
-    Returns:
-        str or None: The detected file extension (e.g., ".pdf") if matched, otherwise None.
+        progress (JobProgress): Reports the job's stage, see parse_archive.
+        chat_id (str): The chat's ID.
+        chat_dir (str): The chat details directory.
+        archive (str): Path of the saved ZIP file.
+        digest (str): Content hash of the archive.
+    Raises:
+        FileNotFoundError, BadZipFile: If the upload isn't a WhatsApp export.
+        TamperedFileError: If the chat file isn't a proper WhatsApp export.
     """
-    try:
-        with open(file_path, "rb") as f:
-            signature = f.read(8).hex().upper()
-    except OSError:
-        return None
+    # Other workers load the finished chat from the parse cache under this key, see load_chat.
+    progress("extracting", 0.0, digest=digest)
+    with stage_seconds.time(stage="process_upload"):
+        _process_upload(progress, chat_id, chat_dir, archive, digest)
 
-    # Common file signatures
-    file_signatures = {
-        "25504446": ".pdf",  # PDF
-        # "504B0304": ".docx",  # ZIP-based formats (DOCX, XLSX, PPTX)
-        # "504B0708": ".zip",  # ZIP file
-        # "D0CF11E0": ".doc",  # Older DOC format
-    }
-
-    for sig, ext in file_signatures.items():
-        if signature.startswith(sig):
-            new_name = file_path.replace(". ", "") + ext
-            os.rename(file_path, new_name)
-            return ext
-    return None
 
+def _process_upload(progress, chat_id: str, chat_dir: str, archive: str, digest: str):
+    """
+    Does the work of process_upload.
+    """
+    # The same export uploaded again is loaded from the parse cache instead of being parsed again,
+    # and a newer export of a chat seen before only has its new messages parsed.
+    with stage_seconds.time(stage="parse_cache_load"):
+        chat = parse_cache.get(digest)
+    base_dir = None
+    if chat is None:
+        try:
+            # Stream the chat text from the archive, only the parsed messages are ever held in memory.
+            chat, base_dir = parse_archive(archive, digest, chat_dir, progress)
+        except (FileNotFoundError, BadZipFile, TamperedFileError):
+            # Keep the directory for the job's status, but not the rejected upload.
+            os.remove(archive)
+            raise
+        parse_cache.put(digest, chat)
+    if not app.config['LAZY_MEDIA']:
+        with stage_seconds.time(stage="extract_media"):
+            extract_new_members(archive, chat_dir, base_dir if base_dir and os.path.isdir(base_dir) else None,
+                                lambda fraction: progress("saving media", fraction))
+    if app.config['CHAT_STORAGE'] == "sqlite":
+        progress("saving chat", 0.0)
+        with stage_seconds.time(stage="write_database"):
+            chat = store_chat(chat, chat_dir)
+    chat_manager = ChatManager()
+    chat_manager.set_chat(chat)
+    chat_store.put(chat_id, chat_manager)
+    if app.config['PREVIEW_PREFETCH']:
+        prefetch_previews(chat, chat_dir)
 
-def get_names(parsed_chat: list) -> list:
+
+def prefetch_previews(chat, chat_dir: str):
     """
-    Extracts all unique names from a parsed WhatsApp chat dictionary.
+    Queues the previews of every image, sticker and video of a chat to be made in the background.
     Args:
-        parsed_chat (list of dict): A list of chat dictionaries containing keys like "name".
-    Returns:
-        list: A sorted list of unique names found in the chat.
+        chat (CompactChat): The parsed chat.
+        chat_dir (str): The chat details directory.
     """
-    return sorted({chat["name"] for chat in parsed_chat if "name" in chat})
+    queued = set()
+    for message in chat:
+        kind = PREVIEW_KINDS.get(message.type)
+        if kind is not None and message.media and message.media not in queued:
+            queued.add(message.media)
+            preview_cache.prefetch(partial(ensure_media, chat_dir, message.media), kind)
 
 
-def extract_contact(filename: str):
+def store_chat(chat, chat_dir: str) -> ChatDatabase:
     """
-    Extracts the contact name and phone number from a VCF (vCard) file.
+    Writes a parsed chat into the database in its directory, for every worker to serve it from.
     Args:
-        filename (str): The name of the VCF file located in "static/chat-details/".
+        chat (CompactChat): The parsed chat.
+        chat_dir (str): The chat details directory.
     Returns:
-        str: The extracted contact details in the format "Name|PhoneNumber",
-             or "|" if extraction fails.
+        ChatDatabase: The chat, read back from its database.
     """
-    # Read file content
-    try:
-        with open(f"static/chat-details/{filename}", "r", encoding="utf-8") as file:
-            vcf_content = file.read()
-    except FileNotFoundError:
-        return "|"
-    # Extract name and number using regex
-    fn_match = re.search(r"FN:(.+)", vcf_content)
-    tel_match = re.search(r"TEL;type=.*?:\+?([\d\s]+)", vcf_content)
-
-    if tel_match and fn_match:
-        phone_number = tel_match.group(1).replace(" ", "").strip("\n")
-        phone_number = "0" + phone_number[3:]
-        return f"{fn_match.group(1)}|{phone_number}"
-    else:
-        return "|"
+    path = os.path.join(chat_dir, DATABASE_NAME)
+    write_chat_database(chat, path, app.config['SQLITE_BATCH_SIZE'])
+    return ChatDatabase(path)
 
 
-def verify_date(date):
+def load_chat(chat_dir: str):
     """
-    Validates if a given string is a date that follows the format MM/DD/YY.
+    Rebuilds a chat from a directory an upload was extracted into, e.g. when another worker handled the upload.
     Args:
-        date (str): The date string to verify.
+        chat_dir (str): The chat details directory.
     Returns:
-        bool: True if the date is valid, otherwise False.
+        ChatManager or None: The chat, or None if the directory holds no readable chat (or its upload is still being
+                             processed).
     """
-    try:
-        datetime.strptime(date, "%m/%d/%y")
-    except ValueError:
-        return False
-    else:
-        return True
+    status = upload_jobs.status(chat_dir)
+    if status is not None and status["stage"] != "done":
+        return None
+    sqlite_storage = app.config['CHAT_STORAGE'] == "sqlite"
+    chat = None
+    if sqlite_storage:
+        try:
+            chat = ChatDatabase(os.path.join(chat_dir, DATABASE_NAME))
+        except sqlite3.Error:
+            # Missing (stored in memory before the setting changed) or unreadable, write it again below.
+            pass
+    if chat is None and status and status.get("digest"):
+        chat = parse_cache.get(status["digest"])
+    if chat is None:
+        try:
+            chat, _ = parse_archive(os.path.join(chat_dir, ARCHIVE_NAME))
+        except (FileNotFoundError, BadZipFile, TamperedFileError):
+            return None
+    if sqlite_storage and not isinstance(chat, ChatDatabase):
+        chat = store_chat(chat, chat_dir)
+    manager = ChatManager()
+    manager.set_chat(chat)
+    return manager
+
+
+
+# GIFs shown beside the chat when gifs.json is missing.
+DEFAULT_GIFS = {
+    "gif1": ['../static/assets/gif/weird-stare.gif', '../static/assets/gif/meme.gif'],
+    "gif2": ['../static/assets/gif/kimetsu-no-yaiba.gif', '../static/assets/gif/eren-jaeger.gif'],
+}
+
 
-def find_and_read_chat_file(file_names: list) -> list:
+def validate_gifs(gifs: dict) -> dict:
     """
-    Peruses through a list of filenames, selects and read the one matching whatsapp
-    chat naming conventions.
+    Checks the GIF lists of gifs.json, dropping (and logging) local GIFs that don't exist and hashing the rest up front,
+    so the first chat rendered doesn't have to.
     Args:
-        file_names (list): All the text files in the chat-details directory.
+        gifs (dict): "gif1" and "gif2", lists of GIF URLs or paths into the static folder ("../static/...").
     Returns:
-        file_content (list): The chat content of the text file with each message as a str.
+        dict: The lists, without the missing local GIFs.
+    Raises:
+        ValueError: If a list is missing, isn't a list of strings, or has no GIF left.
     """
-    file = None
-    for a_file in file_names:
-        if a_file[:8] == "WhatsApp":
-            file = a_file
-            break
+    checked = {}
+    missing = []
+    for side in ("gif1", "gif2"):
+        urls = gifs.get(side)
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise ValueError(f'"{side}" must be a list of GIF URLs')
+        checked[side] = []
+        for url in urls:
+            if url.startswith("../static/"):
+                path = safe_join(STATIC_DIR, url[len("../static/"):])
+                if path is None or fingerprint(path) is None:
+                    missing.append(url)
+                    continue
+            checked[side].append(url)
+        if not checked[side]:
+            raise ValueError(f'"{side}" has no GIF that exists')
+    if missing:
+        app.logger.warning("GIFs not found, skipping them: %s", ", ".join(missing))
+    return checked
 
-    if len(file_names) < 1 or not file:
-        raise FileNotFoundError
-    with open(f"static/chat-details/{file}", mode="r", encoding="utf-8") as txtfile:
-        file_content = txtfile.readlines()
-    return file_content
 
+class UploadRequest(Request):
+    """
+    Request whose uploaded files are streamed into an ArchiveSpool, which hashes and checks the ZIP as it arrives,
+    rather than buffered by Werkzeug and read again afterwards.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return ArchiveSpool(CHAT_DETAILS_DIR, max_members=app.config['UPLOAD_MAX_MEMBERS'],
+                            max_uncompressed=app.config['UPLOAD_MAX_UNCOMPRESSED_BYTES'],
+                            is_chat_file=is_archived_chat_file)
+
+
+# The static folder is served by static_file rather than Flask's own handler.
+app = Flask(__name__, static_folder=None)
+app.request_class = UploadRequest
+app.config['SECRET_KEY'] = '8BYkEfBA6O6donzWlSihBXox7C0sKR6b'
+# How much memory the parsed chats (and their search indexes) may take in each worker, how much disk space the
+# extracted chats may take, and how long (in seconds) an unused chat lives.
+app.config['CHAT_STORE_MAX_BYTES'] = 512 * 1024 * 1024
+app.config['CHAT_STORE_MAX_DISK_BYTES'] = 4 * 1024 * 1024 * 1024
+app.config['CHAT_STORE_TTL'] = 60 * 60
+# Messages per window of the chat view, and the most a single /chat/messages request may ask for.
+app.config['CHAT_PAGE_SIZE'] = 200
+app.config['CHAT_MAX_PAGE_SIZE'] = 1000
+# Most results a single /chat/search request returns.
+app.config['SEARCH_MAX_RESULTS'] = 200
+# Only read the chat text at upload time and extract each attachment the first time it's requested.
+# Set to False to extract the whole archive up front.
+app.config['LAZY_MEDIA'] = True
+# Worker processes used to parse big chats (None means one per CPU), and the smallest chat, in messages,
+# that is parsed in parallel rather than in the request's own process.
+app.config['PARSE_WORKERS'] = None
+app.config['PARALLEL_PARSE_THRESHOLD'] = 50_000
+
+# Uploads are parsed in the background, this many at a time per worker.
+app.config['UPLOAD_WORKERS'] = 2
+# Largest upload accepted, in bytes, and the most members, and extracted bytes, its archive may have.
+# Uploads over a limit are turned down with a 413 as soon as it's exceeded, before anything is extracted.
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024
+app.config['UPLOAD_MAX_MEMBERS'] = 20_000
+app.config['UPLOAD_MAX_UNCOMPRESSED_BYTES'] = 4 * 1024 * 1024 * 1024
+
+# Thumbnails of images and stickers and poster frames of videos are shown instead of the originals. This is their
+# longest side in pixels; they're cached on disk under the hash of the original, up to the given bytes.
+# Up to PREVIEW_WORKERS are made at once, and with PREVIEW_PREFETCH every preview of a chat is made in the
+# background as soon as it's uploaded. That extracts the original of every image, sticker and video, undoing
+# LAZY_MEDIA for them, so it's off by default and previews are made when they're first shown.
+app.config['PREVIEW_SIZES'] = {"thumbnail": 400, "sticker": 200, "poster": 400}
+app.config['PREVIEW_CACHE_DIR'] = "cache/previews"
+app.config['PREVIEW_CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+app.config['PREVIEW_WORKERS'] = 2
+app.config['PREVIEW_PREFETCH'] = False
+
+# Static asset URLs carry a hash of the asset, so browsers cache them for good and only fetch them again once they
+# change. CSS and JS are sent gzip (or brotli) compressed to browsers that take it, compressed once into
+# STATIC_VARIANTS_DIR.
+app.config['STATIC_FINGERPRINT'] = True
+app.config['STATIC_PRECOMPRESS'] = True
+app.config['STATIC_VARIANTS_DIR'] = "cache/static"
+# Seconds browsers may keep attachments and their previews, which never change under a chat's URLs.
+app.config['MEDIA_MAX_AGE'] = 24 * 60 * 60
+
+# GIFs shown beside the chat, read again whenever the file changes.
+app.config['GIFS_FILE'] = "gifs.json"
+
+# With PROFILE_REQUESTS on, requests sent with an "X-Profile: 1" header run under cProfile and the profile is
+# dumped into PROFILE_DIR (uploads get a second one for their background processing). Leave it off in production.
+app.config['PROFILE_REQUESTS'] = False
+app.config['PROFILE_DIR'] = "profiles"
 
-def caution_split(text: str, delimiter: str, n: int) -> list:
+# Where parsed chats are kept: "memory" keeps them in each worker's memory, "sqlite" writes each one into a SQLite
+# file in its directory and serves pages, names, searches and the day index with indexed queries. That file is
+# shared by every worker, survives restarts, and lets chats bigger than memory be served, at the cost of writing
+# it once per upload, SQLITE_BATCH_SIZE messages per transaction.
+app.config['CHAT_STORAGE'] = "memory"
+app.config['SQLITE_BATCH_SIZE'] = 10_000
+
+# Parsed chats are cached on disk under the hash of their archive, up to this many bytes.
+app.config['PARSE_CACHE_DIR'] = "cache/parsed"
+app.config['PARSE_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+
+chat_store = ChatStore(CHAT_DETAILS_DIR, load_chat, max_bytes=app.config['CHAT_STORE_MAX_BYTES'],
+                       max_disk_bytes=app.config['CHAT_STORE_MAX_DISK_BYTES'], ttl=app.config['CHAT_STORE_TTL'],
+                       sizeof=ChatManager.nbytes)
+# Cached chats are pickled CompactChats, bump the version whenever what's pickled changes or moves to another module
+# (or the messages are parsed differently).
+parse_cache = ParseCache(app.config['PARSE_CACHE_DIR'], max_bytes=app.config['PARSE_CACHE_MAX_BYTES'], version=5)
+upload_jobs = UploadJobs(max_workers=app.config['UPLOAD_WORKERS'])
+STATIC_DIR = os.path.join(app.root_path, "static")
+gif_config = ConfigCache(app.config['GIFS_FILE'], default=validate_gifs(DEFAULT_GIFS), validate=validate_gifs)
+static_variants = PrecompressedVariants(app.config['STATIC_VARIANTS_DIR'])
+preview_cache = PreviewCache(app.config['PREVIEW_CACHE_DIR'], app.config['PREVIEW_SIZES'],
+                             max_bytes=app.config['PREVIEW_CACHE_MAX_BYTES'], max_workers=app.config['PREVIEW_WORKERS'])
+# Served on /metrics, per worker process.
+metrics = Registry()
+stage_seconds = metrics.histogram("chat_stage_seconds", "Time spent in each stage of handling a chat.",
+                                  labelnames=("stage",))
+uploaded_bytes = metrics.counter("chat_uploaded_bytes_total", "Bytes of chat archives uploaded.")
+extracted_bytes = metrics.counter("chat_extracted_bytes_total", "Bytes of attachments extracted from archives.")
+lines_read = metrics.counter("chat_lines_total", "Lines of chat text read.")
+messages_parsed = metrics.counter("chat_messages_total", "Messages parsed, by type.", labelnames=("type",))
+# Exceptions of failed uploads that mean the file wasn't a WhatsApp export, rather than a broken one.
+UPLOAD_CLIENT_ERRORS = ("FileNotFoundError", "BadZipFile")
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """
+    Adds the asset's fingerprint to static URLs built with url_for, see static_file.
     """
-    Splits text into at most n parts using delimiter.
-    If the split results in more than n parts, all parts after the first n-1 are joined back together using delimiter
-    as a separator.
+    if endpoint == "static" and app.config['STATIC_FINGERPRINT'] and "v" not in values:
+        path = safe_join(STATIC_DIR, values.get("filename", ""))
+        version = fingerprint(path) if path is not None else None
+        if version is not None:
+            values["v"] = version
+
+
+def asset_url(path: str) -> str:
+    """
+    Turns a path into the static folder, as written in gifs.json, into the asset's fingerprinted URL.
     Args:
-        text (str): The string to be split.
-        delimiter (str): The text separator.
-        n (int): Maximum split amount
-    Returns:
-        split_text (list of str): A list containing up to n parts of the text after splitting.
-    """
-    split_text = text.split(delimiter)
-    if len(split_text) > n:
-        # Text has been split into more than n parts
-        last_part = ""
-        # Merge all split parts together except the first n-1s
-        for j in range(len(split_text)):
-            if j < n-1:
-                continue
-            last_part += split_text[j] + delimiter
-        final_split = split_text
-        split_text = []
-        for i in range(n-1):
-            split_text.append(final_split[i])
-        split_text.append(last_part)
-    return split_text
-
-
-def organize_msgs(msg_list: list) -> list:
-    """
-    Processes and merges messages that were unintentionally split
-    across multiple lines due to newlines.
+        path (str): e.g. "../static/assets/gif/meme.gif". Anything else, like a full URL, is returned as is.
+    """
+    prefix = "../static/"
+    if path.startswith(prefix):
+        return url_for('static', filename=path[len(prefix):])
+    return path
+
+
+@app.route("/static/<path:filename>", endpoint="static")
+def static_file(filename):
+    """
+    Serves a static asset. URLs carrying the asset's current fingerprint are cached by browsers for good,
+    anything else is revalidated with its ETag on every use.
     Args:
-        msg_list (list of str): A list of lines from the WhatsApp chat file.
+        filename (str): The asset's path in the static folder.
     Returns:
-        msg_list (list of str): A cleaned-up list where multiline messages are correctly
-                     merged into single entries.
-    """
-    stopped = 0
-    start_over = False
-    msg_list = msg_list.copy()
-
-    while True:
-        for i in range(len(msg_list)):
-            # In the unlikely case where the procedure is completed but 'start_over' doesn't change to False
-            # This 3 lines will end the loop
-            if stopped == len(msg_list):
-                start_over = False
-                continue
-            # Skip messages that have already been checked
-            if i < stopped:
-                continue
-            # If the current message isn't the start of a new one (It's the continuation of an old one.)
-            if not verify_date(msg_list[i].split(", ")[0]):  #msg_list[i][0].isdigit() or msg_list[i][:8].count("/") != 2:
-                if i == 0:
-                    # File isn't a proper whatsapp chat file (The first message should be a new one)
-                    raise TamperedFileError
-                # Add the continuation message to the message before it and store in 'added'.
-                added = msg_list[i - 1] + " " + msg_list[i]
-                # Replace the message before the continuation message with 'added'
-                msg_list[i - 1] = added
-                # Remove the continuation message from the list
-                msg_list.pop(i)
-                # Reset variables so the function can properly look through the new list
-                stopped = i
-                start_over = True
-                break
-            start_over = False
-        if start_over:
-            # The 'msg_list' had been changed and the function needs to properly look through this new version
-            continue
-        break
-    return msg_list
-
-
-def parse_chat(messages: list) -> list:
-    """
-    Parses a list of WhatsApp chat messages and extracts relevant details such as date, time, sender, message body,
-    and message type.
-    Args:
-        messages (list of str): A list of WhatsApp chat messages, where each message follows the standard
-                                format of a WhatsApp export.
+        Response: The asset, compressed for CSS and JS when the browser takes it, or a 404.
+    """
+    parts = filename.split("/")
+    # Dot files are never assets, and chat-details is where chats were extracted before they moved out of the
+    # static folder: uploads are only served through the chat routes.
+    if parts[0] == "chat-details" or any(part.startswith(".") for part in parts):
+        abort(404)
+    path = safe_join(STATIC_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    version = request.args.get("v")
+    immutable = version is not None and version == fingerprint(path)
+    return send_cached_file(path, max_age=IMMUTABLE_MAX_AGE if immutable else 0, immutable=immutable,
+                            variants=static_variants if app.config['STATIC_PRECOMPRESS'] else None)
 
-    Returns:
-        parsed_chat (list of dict): A list of dictionaries where each dictionary represents a structured
-                                    chat message with the following keys:
-            - "date" (str): The date of the message.
-            - "time" (str): The time the message was sent.
-            - "name" (str, optional): The sender's name (excluded for "info" messages).
-            - "body" (str): The actual message content.
-            - "type" (str): The type of message, which can be one of:
-                - "text" (regular message)
-                - "sticker" (WhatsApp sticker)
-                - "image" (image file)
-                - "audio" (voice note)
-                - "video" (video file)
-                - "contact" (shared contact)
-                - "info" (system-generated messages)
-            - "edited" (bool): Whether the message was edited (True if it contains "<This message was edited>").
-    """
-    parsed_chat = []
-    newline = '\n'
-    for i in messages:
-        # Split message into not more than 2 parts, timeframe(date and time) and message body(sender name and message content)
-        temp_list = caution_split(i, " - ", 2)
-        date, time = temp_list[0].split(", ")
-        if ":" not in temp_list[1]:
-            # Message is a whatsapp system notification/message (Not sent by a person)
-            a_chat = {"date": datetime.strptime(date, "%m/%d/%y"), "time": time, "body": temp_list[1], "type": "info"}
-            parsed_chat.append(a_chat)
-            continue
-        name, msg_body = caution_split(temp_list[1], ": ", 2)
-        # Determine message types and edit message body where necessary.
-        if "(file attached)" not in msg_body:
-            msg_type = "text"
-        elif msg_body[:3] == "STK":
-            msg_type = "sticker"
-        elif msg_body[:3] == "IMG":
-            msg_type = "image"
-            msg_body = msg_body.replace("(file attached)\n", "|")
-        elif msg_body[:3] == "PTT" or msg_body[:3] == "AUD":
-            msg_type = "audio"
-        elif msg_body[:3] == "VID":
-            msg_type = "video"
-        elif ".vcf" in msg_body:
-            msg_type = "contact"
-            msg_body = extract_contact(msg_body.split(".vcf")[0] + ".vcf")
-        elif ".pdf" in msg_body or ".PDF" in msg_body or detect_encrypted_pdf(f"static/chat-details/{msg_body.replace(f'(file attached){newline}', '')}"):
-            msg_type = "pdf"
-            msg_body = msg_body.replace("(file attached)\n", "|")
-            if msg_body[:3] == "DOC":
-                msg_body = msg_body.replace(" |", "pdf")
-        elif re.search(r"\b[\w\s()-]+\.[a-zA-Z0-9]{2,5}\b", msg_body) or "DOC" in msg_body:
-            msg_type = "document"
-        else:
-            msg_type = "text"
-
-        # More message body editing
-        if msg_type != "text":
-            msg_body = msg_body.replace("(file attached)\n", "|").strip(" ")
-        if "<This message was edited>" in msg_body:
-            edited = True
-            msg_body = msg_body.removesuffix("<This message was edited>\n")
-        else:
-            edited = False
-        if "Media omitted" in msg_body:
-            msg_body = msg_body.replace("<", "")
-        # Create dictionary containing message details
-        a_chat = {"date": datetime.strptime(date, "%m/%d/%y"), "time": time, "name": name, "body": msg_body,
-                  "type": msg_type, "edited": edited}
-        parsed_chat.append(a_chat)
-    return parsed_chat
-
-
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '8BYkEfBA6O6donzWlSihBXox7C0sKR6b'
+
+@app.before_request
+def start_profile():
+    """
+    Starts profiling the request if it asks for it and profiling is on, see PROFILE_REQUESTS.
+    """
+    if app.config['PROFILE_REQUESTS'] and request.headers.get("X-Profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def dump_profile(response):
+    """
+    Dumps the profile of a profiled request, naming the file in the X-Profile-File response header.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+        path = profile_path(app.config['PROFILE_DIR'], request.endpoint or "request")
+        profiler.dump_stats(path)
+        response.headers["X-Profile-File"] = path
+    return response
 
 
 @app.route('/')
@@ -380,26 +733,103 @@ def welcome_user():
 @app.route("/upload", methods=["GET", "POST"])
 def decipher():
     """
-    Handles ZIP file uploads, extracts chat data, processes it, and renders name selection.
+    Handles ZIP file uploads: saves the file and queues it to be parsed in the background.
     Returns:
-        Response: Renders the appropriate template based on success or failure.
+        Response: The processing page, which polls upload_status and moves on to the name picker once the chat is
+                  ready. Clients asking for JSON get the job ID and status URL instead, with a 202.
     """
     if request.method == "POST":
-        uploaded_file = request.files.get("zipFile")
-        extract_zipfile(uploaded_file)
-        files = get_files_by_extension("static/chat-details", ".txt")
-        try:
-            txt_content = find_and_read_chat_file(files)
-            new = organize_msgs(txt_content)
-        except FileNotFoundError:
-            return render_template("error4xx.html")
-        except TamperedFileError:
-            return render_template("error5xx.html")
-        chat_manager.set_chat(parse_chat(new))
-        return render_template("pick-name.html", names=get_names(chat_manager.chat))
+        # Reading the form is where the upload is received, spooled and checked.
+        with stage_seconds.time(stage="receive_upload"):
+            uploaded_file = request.files.get("zipFile")
+        if uploaded_file is None:
+            abort(400)
+        if isinstance(uploaded_file.stream, ArchiveSpool):
+            # Walking the local headers can't always see everything, the central directory is the final word.
+            uploaded_file.stream.check_central_directory()
+            uploaded_bytes.inc(uploaded_file.stream.size)
+        # Each upload gets its own ID and directory so concurrent users don't overwrite each other.
+        # The chat ID doubles as the ID of the job processing it.
+        chat_id = chat_store.new_chat_id()
+        chat_dir = chat_store.chat_dir(chat_id)
+        with stage_seconds.time(stage="save_archive"):
+            archive, digest = save_archive(uploaded_file, chat_dir)
+        job = process_upload
+        if "profiler" in g:
+            # The parsing happens on a job thread the request's profiler doesn't see, profile it on its own.
+            job = profiled(process_upload, app.config['PROFILE_DIR'], "process_upload")
+        upload_jobs.submit(chat_dir, job, chat_id, chat_dir, archive, digest)
+        session["chat_id"] = chat_id
+        status_url = url_for('upload_status', job_id=chat_id)
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"job_id": chat_id, "status_url": status_url}), 202
+        return render_template("processing.html", job_id=chat_id, status_url=status_url)
     return redirect(url_for('welcome_user'))
 
 
+@app.errorhandler(NotAChatExport)
+def not_a_chat_export(error):
+    """
+    Renders the "not a WhatsApp export" page for uploads turned down while they were coming in.
+    """
+    return render_template("error4xx.html"), error.code
+
+
+@app.route("/upload/status/<job_id>")
+def upload_status(job_id):
+    """
+    Reports how far the processing of an upload has got. Works from any worker, the status is kept on disk.
+    Args:
+        job_id (str): The job ID returned by the upload.
+    Returns:
+        Response: JSON with "stage" (queued, extracting, merging, parsing, saving media, done or failed) and
+                  "percent", plus "next", the page to go to, once the job is over. 404 for unknown jobs.
+    """
+    try:
+        status = upload_jobs.status(chat_store.chat_dir(job_id))
+    except KeyError:
+        abort(404)
+    if status is None:
+        abort(404)
+    if status["stage"] == "done":
+        status["next"] = url_for('pick_name')
+    elif status["stage"] == "failed":
+        status["next"] = url_for('upload_failed', job_id=job_id)
+    status.pop("digest", None)
+    return jsonify(status)
+
+
+@app.route("/upload/names")
+def pick_name():
+    """
+    Renders the name picker once the uploaded chat is ready.
+    Returns:
+        Response: The name selection page, or a redirect home if the session has no ready chat.
+    """
+    chat_manager = chat_store.get(session.get("chat_id"))
+    if chat_manager is None or chat_manager.chat is None:
+        return redirect(url_for('welcome_user'))
+    return render_template("pick-name.html", names=get_names(chat_manager.chat))
+
+
+@app.route("/upload/failed/<job_id>")
+def upload_failed(job_id):
+    """
+    Explains why an upload couldn't be processed.
+    Args:
+        job_id (str): The failed job's ID.
+    Returns:
+        Response: The "not a WhatsApp export" page, or the "broken export" page.
+    """
+    try:
+        status = upload_jobs.status(chat_store.chat_dir(job_id)) or {}
+    except KeyError:
+        abort(404)
+    if status.get("error") in UPLOAD_CLIENT_ERRORS:
+        return render_template("error4xx.html")
+    return render_template("error5xx.html")
+
+
 @app.route("/chat", methods=["POST"])
 def render_chat():
     """
@@ -408,23 +838,193 @@ def render_chat():
         Response: Renders the chat page with GIFs or redirects if data is missing.
     """
     if request.method == "POST":
-        if chat_manager.chat is None:
+        chat_id = session.get("chat_id")
+        chat_manager = chat_store.get(chat_id)
+        if chat_manager is None or chat_manager.chat is None:
             return redirect(url_for('welcome_user'))
         name = request.form.get("username")
         chat_manager.set_name(name)
-        try:
-            with open(file="gifs.json", mode="r") as file:
-                gifs = json.load(file)
-        except FileNotFoundError:
-            gif1 = ['../static/assets/gif/hello-cute-cat.gif', '../static/assets/gif/meme.gif',]
-            gif2 = ['../static/assets/gif/kimetsu-no-yaiba.gif', '../static/assets/gif/eren-jaeger.gif']
-        else:
-            gif1 = gifs["gif1"]
-            gif2 = gifs["gif2"]
-
-        return render_template("chat.html", chat_manager=chat_manager, left_gifs=gif1, right_gifs=gif2)
+        session["username"] = name
+        gifs = gif_config.get()
+        gif1, gif2 = [asset_url(gif) for gif in gifs["gif1"]], [asset_url(gif) for gif in gifs["gif2"]]
+
+        # Only the first window is rendered here, the page fetches the rest from /chat/messages as it scrolls.
+        page_size = app.config['CHAT_PAGE_SIZE']
+        messages = get_chat_page(chat_manager.chat, 0, page_size)
+        with stage_seconds.time(stage="render_chat"):
+            return render_template("chat.html", chat_id=chat_id,
+                                   messages=messages, offset=0, page_size=page_size,
+                                   total=len(chat_manager.chat), username=name, left_gifs=gif1, right_gifs=gif2)
     return redirect(url_for('welcome_user'))
 
 
+@app.route("/chat/messages")
+def chat_messages():
+    """
+    Returns a window of the current chat as JSON, for the chat view to load as the user scrolls.
+    Query parameters:
+        offset (int, optional): Index of the first message. Defaults to 0.
+        limit (int, optional): Number of messages, capped at CHAT_MAX_PAGE_SIZE. Defaults to CHAT_PAGE_SIZE.
+    Returns:
+        Response: JSON holding the total message count, the window's offset, the offsets of the next and previous
+                  windows (null at either end), the messages and their rendered HTML.
+    """
+    chat_id = session.get("chat_id")
+    chat_manager = chat_store.get(chat_id)
+    if chat_manager is None or chat_manager.chat is None:
+        abort(404)
+    offset = request.args.get("offset", 0, type=int)
+    limit = min(request.args.get("limit", app.config['CHAT_PAGE_SIZE'], type=int), app.config['CHAT_MAX_PAGE_SIZE'])
+    total = len(chat_manager.chat)
+    messages = get_chat_page(chat_manager.chat, offset, limit)
+    offset = min(max(offset, 0), total)
+    with stage_seconds.time(stage="render_messages"):
+        html = render_template("_messages.html", messages=messages, offset=offset,
+                               username=session.get("username"), chat_id=chat_id)
+    return jsonify({
+        "total": total,
+        "offset": offset,
+        "next_offset": offset + len(messages) if offset + len(messages) < total else None,
+        "prev_offset": max(offset - limit, 0) if offset > 0 else None,
+        "messages": [message.to_dict() for message in messages],
+        "html": html,
+    })
+
+
+@app.route("/chat/search")
+def chat_search():
+    """
+    Searches the current chat, returning the offsets of matching messages for the chat view to jump to.
+    Query parameters:
+        q (str, optional): Words that must all appear in the message body or the sender's name.
+        sender (str, optional): Only messages sent by this name.
+        type (str, optional): Only messages of this type, e.g. "image".
+        start, end (str, optional): Only messages between these dates (inclusive), as YYYY-MM-DD.
+        limit (int, optional): Number of results to return, capped at SEARCH_MAX_RESULTS. Defaults to 50.
+    Returns:
+        Response: JSON holding the total number of matches and the first 'limit' of them with a short preview.
+    """
+    chat_manager = chat_store.get(session.get("chat_id"))
+    if chat_manager is None or chat_manager.chat is None:
+        abort(404)
+    # Dates that don't parse are ignored, like any other malformed query parameter.
+    start = request.args.get("start", type=date.fromisoformat)
+    end = request.args.get("end", type=date.fromisoformat)
+    limit = min(request.args.get("limit", 50, type=int), app.config['SEARCH_MAX_RESULTS'])
+    total, offsets = chat_manager.get_search_index().search(
+        request.args.get("q", ""), sender=request.args.get("sender"), msg_type=request.args.get("type"),
+        start=start, end=end, limit=max(limit, 0))
+    results = []
+    for offset in offsets:
+        message = chat_manager.chat[offset]
+        results.append({"offset": offset, "date": message.date.date().isoformat(), "time": message.time,
+                        "name": message.name, "type": message.type, "preview": message.body[:120]})
+    return jsonify({"total": total, "results": results})
+
+
+@app.route("/chat/stats")
+def chat_statistics():
+    """
+    Reports activity statistics of the current chat: messages per sender, by hour and weekday, by type, and edits.
+    Returns:
+        Response: JSON of the statistics, see chat_stats.
+    """
+    chat_manager = chat_store.get(session.get("chat_id"))
+    if chat_manager is None or chat_manager.chat is None:
+        abort(404)
+    return jsonify(chat_manager.get_stats())
+
+
+@app.route("/chat/days")
+def chat_days():
+    """
+    Returns the day index of the current chat, for the chat view's calendar and timeline to jump to a date with.
+    Returns:
+        Response: JSON of the day index, see ChatManager.get_days.
+    """
+    chat_manager = chat_store.get(session.get("chat_id"))
+    if chat_manager is None or chat_manager.chat is None:
+        abort(404)
+    return jsonify(chat_manager.get_days())
+
+
+@app.route("/chat/<chat_id>/media/<path:filename>")
+def chat_media(chat_id, filename):
+    """
+    Serves an attachment of a chat, extracting it from the uploaded archive the first time it's requested.
+    Args:
+        chat_id (str): The chat the attachment belongs to.
+        filename (str): The attachment's file name.
+    Returns:
+        Response: The file, or a 404 if the chat or the attachment doesn't exist.
+    """
+    try:
+        chat_dir = chat_store.chat_dir(chat_id)
+    except KeyError:
+        abort(404)
+    path = ensure_media(chat_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # Attachments without an extension (or with a meaningless one) are sent as the type their content is sniffed as.
+    mimetype = None
+    if mimetypes.guess_type(path)[0] in (None, "application/octet-stream"):
+        mimetype = sniff_mimetype(path)
+    # Supports Range requests, so seeking in audio and video only fetches the part played. Attachments can be large
+    # and are never changed once extracted, so they're tagged by size and modification time rather than hashed.
+    return send_cached_file(path, max_age=app.config['MEDIA_MAX_AGE'], immutable=True, private=True,
+                            hash_content=False, mimetype=mimetype)
+
+
+@app.route("/chat/<chat_id>/<any(thumbnail, sticker, poster):kind>/<path:filename>")
+def chat_preview(chat_id, kind, filename):
+    """
+    Serves the preview of an attachment, made (and cached) the first time it's requested if it wasn't prefetched.
+    Args:
+        chat_id (str): The chat the attachment belongs to.
+        kind (str): "thumbnail" or "sticker" for images, "poster" for videos.
+        filename (str): The attachment's file name.
+    Returns:
+        Response: The preview. When it can't be made, the original for images, or a 404 for posters.
+    """
+    try:
+        chat_dir = chat_store.chat_dir(chat_id)
+    except KeyError:
+        abort(404)
+    # Checked before extracting anything: without ffmpeg, a poster request mustn't pull a whole video out of the ZIP.
+    if kind == "poster" and not preview_cache.available(kind):
+        abort(404)
+    path = ensure_media(chat_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    preview = preview_cache.get(path, kind)
+    if preview is None:
+        if kind == "poster":
+            abort(404)
+        preview = path
+    return send_cached_file(preview, max_age=app.config['MEDIA_MAX_AGE'], immutable=True, private=True,
+                            hash_content=False)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Reports this worker's stage timings and counters, for Prometheus to scrape.
+    Returns:
+        Response: The metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    """
+    Reports the hit and miss counters of this worker's caches, for monitoring.
+    Returns:
+        Response: JSON with one entry per cache.
+    """
+    return jsonify({"parse_cache": parse_cache.stats(), "preview_cache": preview_cache.stats(),
+                    "gif_config": gif_config.stats()})
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
@@ -0,0 +1,246 @@
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from http_cache import file_digest
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional, without it images and stickers are shown full size.
+    Image = None
+
+# Output format and extension of every kind of preview. Stickers keep their transparency.
+PREVIEW_FORMATS = {
+    "thumbnail": ("JPEG", ".jpg"),
+    "sticker": ("PNG", ".png"),
+    "poster": ("JPEG", ".jpg"),
+}
+
+
+def make_thumbnail(source: str, target: str, size: int, image_format: str):
+    """
+    Writes a downscaled copy of an image.
+    Args:
+        source (str): The original image.
+        target (str): Where to write the copy.
+        size (int): Longest side of the copy, in pixels. Smaller images are only re-encoded.
+        image_format (str): Pillow format name, "JPEG" or "PNG".
+    """
+    with Image.open(source) as image:
+        # Lets JPEGs be decoded straight at a fraction of their size, much cheaper than decoding them whole.
+        image.draft("RGB", (size, size))
+        # Phones save photos sideways with a rotation tag, apply it since the tag is dropped.
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image = image.convert("RGB" if image_format == "JPEG" else "RGBA")
+        image.save(target, image_format, quality=80, optimize=True)
+
+
+def make_poster(source: str, target: str, size: int, ffmpeg: str):
+    """
+    Writes the first frame of a video as a downscaled JPEG.
+    Args:
+        source (str): The video.
+        target (str): Where to write the frame.
+        size (int): Longest side of the frame, in pixels.
+        ffmpeg (str): Path of the ffmpeg executable.
+    Raises:
+        OSError: If ffmpeg failed or wrote nothing.
+    """
+    scale = f"scale=w='min(iw,{size})':h='min(ih,{size})':force_original_aspect_ratio=decrease"
+    command = [ffmpeg, "-v", "error", "-y", "-i", source, "-frames:v", "1", "-vf", scale, "-f", "image2",
+               "-c:v", "mjpeg", target]
+    result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, timeout=60)
+    if result.returncode != 0 or not os.path.getsize(target):
+        raise OSError(result.stderr.decode("utf-8", "replace").strip() or "ffmpeg wrote no frame")
+
+
+class PreviewCache:
+    """
+    Makes small previews of attachments, thumbnails of images and stickers and poster frames of videos, and keeps
+    them on disk under the hash of the original's content, so the same attachment in another upload (or another
+    export of the same chat) reuses its previews. The cache is kept under 'max_bytes' by dropping the least
+    recently used previews.
+
+    Thumbnails need Pillow and posters need ffmpeg; without them get returns None and callers fall back to the
+    original (or nothing, for posters).
+
+    Attributes:
+        root (str): Directory holding the previews.
+        sizes (dict): Longest side, in pixels, of every kind of preview.
+        max_bytes (int): Total size the cache may grow to on disk.
+        max_workers (int): Previews made at once, in the background pool and requests together.
+        ffmpeg (str or None): Path of the ffmpeg executable, if it's installed.
+        hits (int): Previews found already made.
+        generated (int): Previews made.
+        failures (int): Originals no preview could be made from.
+        evictions (int): Previews dropped to keep the cache under 'max_bytes'.
+    """
+    # Previews made between two checks of the cache's size.
+    EVICT_EVERY = 64
+
+    def __init__(self, root: str, sizes: dict, max_bytes: int = 256 * 1024 * 1024, max_workers: int = 2):
+        """
+        Initializes the cache, the directory is created on the first preview and the threads on the first prefetch.
+        """
+        self.root = root
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.hits = 0
+        self.generated = 0
+        self.failures = 0
+        self.evictions = 0
+        self._slots = threading.Semaphore(max_workers)
+        self._lock = threading.Lock()
+        self._making = {}
+        self._failed = set()
+        self._executor = None
+
+    def available(self, kind: str) -> bool:
+        """
+        Tells whether previews of a kind can be made here.
+        """
+        return self.ffmpeg is not None if kind == "poster" else Image is not None
+
+    def path(self, digest: str, kind: str) -> str:
+        """
+        Returns the file a preview is kept in.
+        Args:
+            digest (str): Hex digest of the original.
+            kind (str): "thumbnail", "sticker" or "poster".
+        """
+        return os.path.join(self.root, digest[:2], f"{digest}-{kind}{self.sizes[kind]}{PREVIEW_FORMATS[kind][1]}")
+
+    def get(self, source: str, kind: str):
+        """
+        Returns the preview of an attachment, making it first if it isn't cached yet.
+        Args:
+            source (str): Path of the original.
+            kind (str): "thumbnail", "sticker" or "poster".
+        Returns:
+            str or None: Path of the preview, or None if it can't be made.
+        """
+        if not self.available(kind):
+            return None
+        try:
+            target = self.path(file_digest(source), kind)
+        except OSError:
+            return None
+        if os.path.exists(target):
+            self._used(target)
+            return target
+        with self._lock:
+            if target in self._failed:
+                return None
+            # Requests for a preview that's being made wait for it rather than making it again.
+            making = self._making.setdefault(target, threading.Lock())
+        with making:
+            if os.path.exists(target):
+                self._used(target)
+                return target
+            try:
+                with self._slots:
+                    self._make(source, target, kind)
+            except Exception as error:
+                print(f"Couldn't make a {kind} of {source}: {error}")
+                with self._lock:
+                    self.failures += 1
+                    self._failed.add(target)
+                return None
+            finally:
+                with self._lock:
+                    self._making.pop(target, None)
+        with self._lock:
+            self.generated += 1
+            evict = self.generated % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+        return target
+
+    def _used(self, target: str):
+        """
+        Counts a hit and marks the preview as recently used for eviction.
+        """
+        try:
+            os.utime(target)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+
+    def _make(self, source: str, target: str, kind: str):
+        """
+        Makes a preview, writing it under a temporary name first so no reader ever sees half of one.
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        image_format, extension = PREVIEW_FORMATS[kind]
+        partial = f"{target}.{os.getpid()}.{threading.get_ident()}.part{extension}"
+        try:
+            if kind == "poster":
+                make_poster(source, partial, self.sizes[kind], self.ffmpeg)
+            else:
+                make_thumbnail(source, partial, self.sizes[kind], image_format)
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def prefetch(self, locate, kind: str):
+        """
+        Queues a preview to be made in the background, so it's ready by the time it's first shown.
+        Args:
+            locate (callable): Returns the path of the original, called in the background so it can extract it first.
+            kind (str): "thumbnail", "sticker" or "poster".
+        """
+        if not self.available(kind):
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="preview")
+            self._executor.submit(self._prefetch, locate, kind)
+
+    def _prefetch(self, locate, kind: str):
+        """
+        Makes a queued preview.
+        """
+        source = locate()
+        if source is not None and os.path.isfile(source):
+            self.get(source, kind)
+
+    def evict(self):
+        """
+        Removes least recently used previews until the cache fits in 'max_bytes'.
+        """
+        entries = []
+        try:
+            for folder in os.scandir(self.root):
+                if folder.is_dir():
+                    entries.extend(entry for entry in os.scandir(folder.path) if ".part" not in entry.name)
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total = 0
+        for entry in entries:
+            total += entry.stat().st_size
+            if total > self.max_bytes:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                with self._lock:
+                    self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        Returns:
+            dict: Hits, previews generated, failures, evictions and the hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.generated
+            return {"hits": self.hits, "generated": self.generated, "failures": self.failures,
+                    "evictions": self.evictions, "hit_ratio": self.hits / lookups if lookups else 0.0}
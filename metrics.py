@@ -0,0 +1,211 @@
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets: from a fast template render to parsing a huge chat.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    """
+    Orders label values by label name, checking every label is given.
+    Raises:
+        ValueError: If labels are missing or unknown.
+    """
+    if labels.keys() != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    """
+    Formats labels the way the Prometheus text format writes them, e.g. '{stage="parse"}'.
+    """
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, escaped)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    A count that only goes up, one per combination of label values.
+
+    Attributes:
+        name (str): Metric name, ending in "_total".
+        help (str): What it counts.
+        labelnames (tuple of str): Names of its labels.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Adds to the count of the given label values.
+        """
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        Returns the count of the given label values.
+        """
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self) -> list:
+        """
+        Returns the metric's lines in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values, latencies in seconds here, in cumulative buckets, one set per combination of
+    label values.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): What it measures.
+        labelnames (tuple of str): Names of its labels.
+        buckets (tuple of float): Upper bounds of the buckets, ascending.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label values: count in each bucket (not cumulative, the last one is +Inf), sum and count.
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        Records a value for the given label values.
+        """
+        key = _label_key(self.labelnames, labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Records how long the block takes, in seconds, whether or not it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """
+        Returns how many values were recorded for the given label values.
+        """
+        with self._lock:
+            values = self._values.get(_label_key(self.labelnames, labels))
+        return values[2] if values else 0
+
+    def render(self) -> list:
+        """
+        Returns the metric's lines in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of a process, rendered together for Prometheus to scrape. Every worker process has its own,
+    Prometheus adds them up across the workers it scrapes.
+    """
+    NAME_PATTERN = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if not self.NAME_PATTERN.fullmatch(metric.name) or metric.name in self._metrics:
+            raise ValueError(f"invalid or duplicate metric name: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        """
+        Creates and registers a counter.
+        """
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Creates and registers a histogram.
+        """
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def profile_path(directory: str, name: str) -> str:
+    """
+    Returns a fresh file name to dump a profile in, e.g. "profiles/20240102-211507-123456-render_chat.prof".
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 1_000_000:06d}"
+    return os.path.join(directory, f"{stamp}-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.prof")
+
+
+def profiled(function, directory: str, name: str):
+    """
+    Wraps a function so each call runs under cProfile, dumping the profile into a file once it returns.
+    Used for work that runs on another thread than the request that asked for the profile.
+    Args:
+        function (callable): The function.
+        directory (str): Where to dump profiles, created if missing.
+        name (str): Goes into the profile's file name.
+    Returns:
+        callable: The wrapped function.
+    """
+    def run(*args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(profile_path(directory, name))
+    return run
@@ -0,0 +1,161 @@
+import json
+import os
+import pickle
+import threading
+
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of parsed chats.
+
+    Parsed chats are pickled under the hash of the archive they came from, so uploading the same export again
+    skips parsing altogether. The cache is kept under 'max_bytes' by dropping the least recently used entries.
+
+    It also remembers, by a fingerprint of each chat's first messages, the latest parse of every chat it has seen,
+    so a newer export of the same chat only needs its new messages parsed.
+
+    Attributes:
+        root (str): Directory holding the cached chats.
+        max_bytes (int): Total size the cache may grow to on disk.
+        version (int): Bumped whenever the parsed format changes, entries of other versions are never read.
+        hits (int): Lookups of an archive answered from the cache.
+        misses (int): Lookups of an archive that weren't. Lookups of a chat's latest parse aren't counted.
+        evictions (int): Entries dropped to keep the cache under 'max_bytes'.
+    """
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024, version: int = 1):
+        """
+        Initializes the cache, the directory is created on the first write.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        """
+        Returns the file a key is cached in.
+        Args:
+            key (str): The archive's hex digest.
+        """
+        return os.path.join(self.root, f"v{self.version}-{key}.pickle")
+
+    def get(self, key: str):
+        """
+        Loads a cached chat.
+        Args:
+            key (str): The archive's hex digest.
+        Returns:
+            The cached chat, or None on a miss.
+        """
+        chat = self._load(key)
+        with self._lock:
+            if chat is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return chat
+
+    def _load(self, key: str):
+        """
+        Loads a cached chat like get, without counting the lookup.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                chat = pickle.load(file)
+            # Mark the entry as recently used for eviction.
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Missing, truncated, or pickled by code that has since moved.
+            return None
+        return chat
+
+    def put(self, key: str, chat):
+        """
+        Caches a parsed chat and evicts old entries if the cache grew too big.
+        Args:
+            key (str): The archive's hex digest.
+            chat: The parsed chat.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(key)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(partial, "wb") as file:
+            pickle.dump(chat, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in 'max_bytes'.
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.root) if entry.name.endswith(".pickle")]
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total = 0
+        for entry in entries:
+            total += entry.stat().st_size
+            if total > self.max_bytes:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                with self._lock:
+                    self.evictions += 1
+
+    def fingerprint_path(self, fingerprint: str) -> str:
+        """
+        Returns the file the record of a chat fingerprint is kept in.
+        Args:
+            fingerprint (str): Hex digest of the chat's first messages.
+        """
+        return os.path.join(self.root, f"v{self.version}-fp-{fingerprint}.json")
+
+    def get_latest(self, fingerprint: str):
+        """
+        Looks up the latest cached parse of a chat by its fingerprint.
+        Args:
+            fingerprint (str): Hex digest of the chat's first messages.
+        Returns:
+            tuple or None: The record saved with put_latest and the cached chat, or None if either is gone.
+        """
+        try:
+            with open(self.fingerprint_path(fingerprint), "r", encoding="utf-8") as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # Not counted: 'hits' and 'misses' are about whole archives, and this lookup follows a miss for the new one.
+        chat = self._load(record["key"])
+        if chat is None:
+            return None
+        return record, chat
+
+    def put_latest(self, fingerprint: str, record: dict):
+        """
+        Records the latest parse of a chat.
+        Args:
+            fingerprint (str): Hex digest of the chat's first messages.
+            record (dict): Must hold "key", the archive digest the parsed chat is cached under.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self.fingerprint_path(fingerprint)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump(record, file)
+        os.replace(partial, path)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        Returns:
+            dict: Hits, misses, evictions and the hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
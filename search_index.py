@@ -0,0 +1,208 @@
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from array import array
+from bisect import bisect_left, bisect_right
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """
+    Folds case and strips accents, so "Café" and "cafe" match.
+    Args:
+        text (str): The text to normalize.
+    Returns:
+        str: The normalized text.
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into normalized word tokens.
+    Args:
+        text (str): The text to split.
+    Returns:
+        list of str: The tokens, in order, duplicates included.
+    """
+    if text.isascii():
+        # Nothing to strip, skip the unicode work.
+        return TOKEN_PATTERN.findall(text.lower())
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def _intersect(small, large: array) -> list:
+    """
+    Intersects two sorted posting lists.
+    """
+    if len(small) > len(large):
+        small, large = large, small
+    if len(small) * 16 < len(large):
+        # Much shorter list: look each offset up in the longer one instead of walking both.
+        result = []
+        for offset in small:
+            position = bisect_left(large, offset)
+            if position < len(large) and large[position] == offset:
+                result.append(offset)
+        return result
+    return sorted(set(small).intersection(large))
+
+
+NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def _first_bits(bits: int, size: int, limit: int) -> list:
+    """
+    Returns the positions of the lowest 'limit' set bits of a bitmap of 'size' bits.
+    """
+    data = bits.to_bytes(size // 8 + 1, "little")
+    positions = []
+    for match in NONZERO_BYTE.finditer(data):
+        byte, base = data[match.start()], match.start() * 8
+        for bit in range(8):
+            if byte >> bit & 1:
+                positions.append(base + bit)
+        if len(positions) >= limit:
+            break
+    return positions[:limit]
+
+
+class SearchIndex:
+    """
+    Inverted index over a parsed chat, from normalized tokens of each message's body and sender to the offsets of
+    the messages containing them.
+
+    Posting lists that cover more than 1/64 of the chat also get a bitmap, built the first time a query needs it,
+    so intersecting common words is a big-integer AND rather than a walk over hundreds of thousands of offsets.
+
+    Attributes:
+        postings (dict): Token to the sorted offsets of the messages containing it.
+        senders (dict): Sender name to the offsets of their messages.
+        types (dict): Message type to the offsets of messages of that type.
+        days (array): Date ordinal of every message, in chat order.
+        chronological (bool): Whether 'days' is sorted, which lets date ranges be found by bisection.
+    """
+    MAX_BITMAPS = 128
+
+    def __init__(self, chat: list):
+        """
+        Builds the index in a single pass over the chat.
+        Args:
+            chat (list of Message): The parsed chat.
+        """
+        self.postings = {}
+        self.senders = {}
+        self.types = {}
+        self.days = array("I")
+        for offset, message in enumerate(chat):
+            self.days.append(message.date.toordinal())
+            self.types.setdefault(message.type, array("I")).append(offset)
+            tokens = set(tokenize(message.body))
+            if message.name is not None:
+                self.senders.setdefault(message.name, array("I")).append(offset)
+                tokens.update(tokenize(message.name))
+            for token in tokens:
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = array("I")
+                postings.append(offset)
+        self.chronological = all(a <= b for a, b in zip(self.days, self.days[1:]))
+        self.dense = len(self.days) // 64 + 1
+        self._bitmaps = OrderedDict()
+        self._lock = threading.Lock()
+        # Measured once, the lists don't change after this.
+        self._postings_bytes = sum(sys.getsizeof(key) + sys.getsizeof(offsets)
+                                   for table in (self.postings, self.senders, self.types)
+                                   for key, offsets in table.items())
+        self._postings_bytes += sum(map(sys.getsizeof, (self.postings, self.senders, self.types, self.days)))
+
+    def nbytes(self) -> int:
+        """
+        Returns roughly how much memory the index takes, its posting lists and the bitmaps cached so far.
+        """
+        with self._lock:
+            # Every bitmap is kept both as bytes and as an int of the same size.
+            return self._postings_bytes + sum(2 * len(bits) for bits, _ in self._bitmaps.values())
+
+    def _bitmap(self, key: tuple, postings: array) -> tuple:
+        """
+        Returns a posting list as a bitmap, both as bytes (for testing single offsets) and as an int (for ANDing).
+        """
+        with self._lock:
+            bitmap = self._bitmaps.get(key)
+            if bitmap is not None:
+                self._bitmaps.move_to_end(key)
+                return bitmap
+        bits = bytearray(len(self.days) // 8 + 1)
+        for offset in postings:
+            bits[offset >> 3] |= 1 << (offset & 7)
+        bitmap = (bytes(bits), int.from_bytes(bits, "little"))
+        with self._lock:
+            self._bitmaps[key] = bitmap
+            while len(self._bitmaps) > self.MAX_BITMAPS:
+                self._bitmaps.popitem(last=False)
+        return bitmap
+
+    def search(self, query: str = "", sender: str = None, msg_type: str = None, start=None, end=None,
+               limit: int = 50) -> tuple:
+        """
+        Finds the messages containing every word of a query.
+        Args:
+            query (str, optional): Words to look for, in the body or the sender's name. Empty matches every message.
+            sender (str, optional): Only messages sent by this exact name.
+            msg_type (str, optional): Only messages of this type, e.g. "image".
+            start (date, optional): Only messages on or after this date.
+            end (date, optional): Only messages on or before this date.
+            limit (int, optional): Most offsets to return. Defaults to 50.
+        Returns:
+            tuple: The number of matching messages and the offsets of the first 'limit' of them, in chat order.
+        """
+        lists = [(("token", token), self.postings.get(token, array("I"))) for token in set(tokenize(query))]
+        if sender is not None:
+            lists.append((("sender", sender), self.senders.get(sender, array("I"))))
+        if msg_type is not None:
+            lists.append((("type", msg_type), self.types.get(msg_type, array("I"))))
+        lists.sort(key=lambda item: len(item[1]))
+
+        low, high = 0, len(self.days)
+        first_day, last_day = (start.toordinal() if start else 0), (end.toordinal() if end else float("inf"))
+        if self.chronological:
+            if start is not None:
+                low = bisect_left(self.days, first_day)
+            if end is not None:
+                high = bisect_right(self.days, last_day)
+            if not lists:
+                return max(high - low, 0), list(range(low, min(high, low + limit)))
+        elif not lists:
+            lists = [(("all",), array("I", range(len(self.days))))]
+
+        if self.chronological and len(lists[0][1]) >= self.dense:
+            # Every list is common: AND their bitmaps, masked to the date range.
+            bits = (1 << high) - (1 << low) if high > low else 0
+            for key, postings in lists:
+                bits &= self._bitmap(key, postings)[1]
+                if not bits:
+                    break
+            return bits.bit_count(), _first_bits(bits, len(self.days), limit)
+
+        # Start from the rarest list and narrow it down with each of the others.
+        postings = lists[0][1]
+        first, last = bisect_left(postings, low), bisect_left(postings, high)
+        if len(lists) == 1 and self.chronological:
+            return last - first, list(postings[first:min(last, first + limit)])
+        candidates = postings[first:last]
+        for key, postings in lists[1:]:
+            if not candidates:
+                break
+            if len(postings) >= self.dense:
+                bits = self._bitmap(key, postings)[0]
+                candidates = [offset for offset in candidates if bits[offset >> 3] >> (offset & 7) & 1]
+            else:
+                candidates = _intersect(candidates, postings)
+        if not self.chronological and (start is not None or end is not None):
+            candidates = [offset for offset in candidates if first_day <= self.days[offset] <= last_day]
+        return len(candidates), list(candidates[:limit])
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobProgress:
+    """
+    Reports how far a job has got by writing its status file, which every worker process can read.
+    Only stage changes and whole percent steps are written, so calling it often is cheap.
+
+    Attributes:
+        path (str): The job's status file.
+        stage (str): The stage last reported.
+        percent (int): The percentage last reported.
+        details (dict): Extra fields reported so far, kept in every status written after them.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the reporter.
+        Args:
+            path (str): The job's status file.
+        """
+        self.path = path
+        self.stage = None
+        self.percent = None
+        self.details = {}
+
+    def __call__(self, stage: str, fraction: float = 0.0, **details):
+        """
+        Records the stage a job is in.
+        Args:
+            stage (str): e.g. "parsing".
+            fraction (float, optional): How much of the stage is done, from 0 to 1.
+            **details: Extra fields for the status, e.g. an ID of the result for other workers to find it by.
+        """
+        percent = int(min(max(fraction, 0.0), 1.0) * 100)
+        if stage == self.stage and percent == self.percent and not details:
+            return
+        self.stage, self.percent = stage, percent
+        self.details.update(details)
+        write_status(self.path, {**self.details, "stage": stage, "percent": percent})
+
+
+def write_status(path: str, status: dict):
+    """
+    Writes a status file, atomically so readers never see half of one.
+    Args:
+        path (str): The status file.
+        status (dict): JSON ready status.
+    """
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(partial, "w", encoding="utf-8") as file:
+        json.dump(status, file)
+    os.replace(partial, path)
+
+
+class UploadJobs:
+    """
+    Runs upload processing in the background, so the upload request returns as soon as the file is saved.
+
+    Every job lives in its own directory and keeps its status there in STATUS_FILE, so whichever worker process gets
+    asked about a job can answer, not just the one running it. A status is a dict with "stage" ("queued", then
+    whatever stages the job reports, then "done" or "failed") and "percent", plus "error" (the exception's class
+    name) for failed jobs.
+
+    Attributes:
+        max_workers (int): Jobs run at once in this process, the rest wait in line.
+    """
+    # Leading dot: WhatsApp never names attachments like that, so extracting one can't overwrite it.
+    STATUS_FILE = ".status.json"
+
+    def __init__(self, max_workers: int = 2):
+        """
+        Initializes the runner, its threads are started on the first job.
+        """
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def status_path(self, job_dir: str) -> str:
+        """
+        Returns the status file of the job in a directory.
+        """
+        return os.path.join(job_dir, self.STATUS_FILE)
+
+    def submit(self, job_dir: str, function, *args):
+        """
+        Queues a job.
+        Args:
+            job_dir (str): The job's directory, which must exist.
+            function (callable): Does the work, called as function(progress, *args) where progress is a JobProgress.
+                                 Whatever it returns is ignored; raising marks the job as failed.
+            *args: Passed on to 'function'.
+        """
+        path = self.status_path(job_dir)
+        write_status(path, {"stage": "queued", "percent": 0})
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upload")
+            self._executor.submit(self._run, path, function, args)
+
+    @staticmethod
+    def _run(path: str, function, args: tuple):
+        """
+        Runs a job, recording how it ended.
+        """
+        progress = JobProgress(path)
+        try:
+            function(progress, *args)
+        except Exception as error:
+            print(f"Upload job failed: {traceback.format_exc()}")
+            if os.path.isdir(os.path.dirname(path)):
+                progress("failed", 1.0, error=type(error).__name__)
+        else:
+            progress("done", 1.0)
+
+    def status(self, job_dir: str):
+        """
+        Reads the status of the job in a directory.
+        Args:
+            job_dir (str): The job's directory.
+        Returns:
+            dict or None: The status, or None if there's no job there.
+        """
+        try:
+            with open(self.status_path(job_dir), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
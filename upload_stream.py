@@ -0,0 +1,210 @@
+import hashlib
+import os
+import struct
+import tempfile
+from zipfile import BadZipFile, ZipFile
+
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+# Version, flags, method, time, date, CRC, compressed size, uncompressed size, name length, extra length.
+LOCAL_FILE_HEADER_FORMAT = struct.Struct("<HHHHHIIIHH")
+LOCAL_FILE_HEADER_SIZE = 4 + LOCAL_FILE_HEADER_FORMAT.size
+# General purpose flags: sizes come after the data instead of in the header, and names are UTF-8.
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+
+class ArchiveTooLarge(RequestEntityTooLarge):
+    """
+    Raised when an uploaded archive has more members, or would extract to more bytes, than allowed.
+    """
+    description = "The archive has too many files in it, or they're too big once extracted."
+
+
+class NotAChatExport(UnsupportedMediaType):
+    """
+    Raised when an upload isn't a ZIP file, or is one without a WhatsApp chat in it.
+    """
+    description = "The upload isn't a WhatsApp chat export."
+
+
+class ArchiveSpool:
+    """
+    File that Werkzeug's form parser writes an uploaded ZIP into, chunk by chunk, instead of buffering it.
+
+    Each chunk is written straight to a temporary file next to the chat directories and added to a running SHA-256,
+    so the upload never has to be read again to be saved or hashed. On the way, the archive's local file headers are
+    followed to count members and add up their uncompressed sizes, so a zip bomb or an archive that plainly isn't
+    a chat export is rejected while it's still coming in. Members whose sizes only come after their data can't be
+    skipped without decompressing them, so once one turns up the limits are left to check_central_directory,
+    run once the upload is complete.
+
+    The limits only trust sizes declared in the archive, which is safe as zipfile never reads more than a member's
+    declared size out of it.
+
+    Attributes:
+        max_members (int): Most files (and directories) allowed in the archive.
+        max_uncompressed (int): Most bytes the archive's files may add up to once extracted.
+        is_chat_file (callable): Tells, from a member's name, whether it is the chat text.
+        size (int): Bytes received so far.
+        members (int): Local file headers seen so far.
+        uncompressed (int): Declared uncompressed size of the members seen so far.
+        chat_file (str or None): Name of the chat text member, once seen.
+    """
+
+    def __init__(self, directory: str, max_members: int, max_uncompressed: int, is_chat_file):
+        """
+        Creates the temporary file the upload is spooled to.
+        Args:
+            directory (str): Where to spool it, on the same file system as the chat directories.
+            max_members (int): Most members allowed in the archive.
+            max_uncompressed (int): Most bytes the members may add up to.
+            is_chat_file (callable): Tells, from a member's name, whether it is the chat text.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", suffix=".part")
+        self.max_members = max_members
+        self.max_uncompressed = max_uncompressed
+        self.is_chat_file = is_chat_file
+        self.size = 0
+        self.members = 0
+        self.uncompressed = 0
+        self.chat_file = None
+        self._digest = hashlib.sha256()
+        self._buffer = bytearray()
+        self._skip = 0
+        self._following = True
+
+    def write(self, data: bytes) -> int:
+        """
+        Spools the next chunk of the upload and checks the headers that arrived with it.
+        Raises:
+            ArchiveTooLarge: If the archive goes over one of the limits.
+            NotAChatExport: If the upload isn't a ZIP file, or all its members went by without the chat text.
+        """
+        self.file.write(data)
+        self._digest.update(data)
+        self.size += len(data)
+        if self._following:
+            try:
+                self._follow(data)
+            except (ArchiveTooLarge, NotAChatExport):
+                # The form parser never hands the file over after this, so nothing else would delete it.
+                self.close()
+                raise
+        return len(data)
+
+    def _follow(self, data: bytes):
+        """
+        Walks the local file headers in the new data, skipping over member contents.
+        """
+        if self._skip >= len(data):
+            self._skip -= len(data)
+            return
+        self._buffer += memoryview(data)[self._skip:]
+        self._skip = 0
+        buffer = self._buffer
+        while len(buffer) >= 4:
+            signature = bytes(buffer[:4])
+            if signature in (CENTRAL_DIRECTORY_HEADER, END_OF_CENTRAL_DIRECTORY):
+                # Every member has gone by.
+                self._stop_following()
+                if self.chat_file is None:
+                    raise NotAChatExport()
+                return
+            if signature != LOCAL_FILE_HEADER:
+                if self.members == 0:
+                    raise NotAChatExport()
+                # Something this walk doesn't handle, leave it to the central directory.
+                self._stop_following()
+                return
+            if len(buffer) < LOCAL_FILE_HEADER_SIZE:
+                return
+            _, flags, _, _, _, _, compressed, uncompressed, name_length, extra_length = \
+                LOCAL_FILE_HEADER_FORMAT.unpack_from(buffer, 4)
+            header_size = LOCAL_FILE_HEADER_SIZE + name_length + extra_length
+            if len(buffer) < header_size:
+                return
+            name = bytes(buffer[LOCAL_FILE_HEADER_SIZE:LOCAL_FILE_HEADER_SIZE + name_length])
+            name = name.decode("utf-8" if flags & FLAG_UTF8 else "cp437", "replace")
+            self.members += 1
+            if self.members > self.max_members:
+                raise ArchiveTooLarge()
+            if self.chat_file is None and self.is_chat_file(name):
+                self.chat_file = name
+            if flags & FLAG_DATA_DESCRIPTOR or 0xFFFFFFFF in (compressed, uncompressed):
+                # Sizes come after the data (or in a ZIP64 extra field): can't tell where the next header starts.
+                self._stop_following()
+                return
+            self.uncompressed += uncompressed
+            if self.uncompressed > self.max_uncompressed:
+                raise ArchiveTooLarge()
+            member_size = header_size + compressed
+            if len(buffer) < member_size:
+                self._skip = member_size - len(buffer)
+                buffer.clear()
+                return
+            del buffer[:member_size]
+
+    def _stop_following(self):
+        self._following = False
+        self._buffer = bytearray()
+
+    def check_central_directory(self):
+        """
+        Checks the complete archive against the limits using its central directory, without extracting anything.
+        Raises:
+            ArchiveTooLarge: If the archive goes over one of the limits.
+            NotAChatExport: If the upload isn't a readable ZIP file, or has no chat text.
+        """
+        self.file.flush()
+        position = self.file.tell()
+        try:
+            with ZipFile(self.file) as archive:
+                members = archive.infolist()
+        except BadZipFile:
+            raise NotAChatExport()
+        finally:
+            self.file.seek(position)
+        if len(members) > self.max_members or sum(info.file_size for info in members) > self.max_uncompressed:
+            raise ArchiveTooLarge()
+        if not any(self.is_chat_file(info.filename) for info in members):
+            raise NotAChatExport()
+
+    def hexdigest(self) -> str:
+        """
+        Returns the SHA-256 hex digest of everything written so far.
+        """
+        return self._digest.hexdigest()
+
+    def save_as(self, path: str):
+        """
+        Gives the spooled upload its permanent name, without copying it.
+        Args:
+            path (str): Where it should live, on the same file system, and not existing yet.
+        """
+        self.file.flush()
+        # Link rather than move, the temporary file deletes its own name when closed.
+        os.link(self.file.name, path)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def close(self):
+        """
+        Closes and deletes the temporary file; a copy saved with save_as stays.
+        """
+        self.file.close()
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed